@@ -0,0 +1,304 @@
+"""
+Benchmarks for the finances data model.
+"""
+import argparse
+import csv
+import datetime
+import pickle
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from finances.finances import (
+    MONTHS_IN_YEAR,
+    Category,
+    Month,
+    Transaction,
+    TransactionType,
+    Year,
+)
+from finances.replay import ReplayClient, record_spreadsheet
+from finances.rules import Rule, RuleSet
+from main import Sheet, fetch_tables, import_statement, parse_years, read_worksheet
+from unittest import mock
+
+# A decade of data at a typical number of rows per month.
+YEARS = range(2016, 2026)
+TRANSACTIONS_PER_MONTH = 150
+# Number of distinct payees and notes to draw rows from.
+NUM_DESCRIPTIONS = 400
+NUM_NOTES = 40
+
+
+@dataclass
+class LegacyTransaction:
+    """
+    The previous Transaction representation: a regular dataclass holding a
+    datetime and its own copies of the description and note strings.
+    """
+
+    date: datetime.datetime
+    transaction_type: TransactionType
+    category: Category
+    description: str
+    amount: float
+    note: str
+
+
+def synthetic_rows(seed: int = 0):
+    """
+    Yield tuples of raw field values for a synthetic decade of transactions.
+    Strings are copied per row, as they are when each cell is decoded from a
+    worksheet response.
+    """
+    rng = random.Random(seed)
+    descriptions = [
+        f"PAYEE {i} REF {i * 7919 % 100000}" for i in range(NUM_DESCRIPTIONS)
+    ]
+    notes = [""] * NUM_NOTES + [f"note {i}" for i in range(NUM_NOTES)]
+    types = list(TransactionType)
+    categories = list(Category)
+    for year in YEARS:
+        for month in range(1, MONTHS_IN_YEAR + 1):
+            for _ in range(TRANSACTIONS_PER_MONTH):
+                yield (
+                    year,
+                    month,
+                    datetime.datetime(year, month, rng.randint(1, 28)),
+                    rng.choice(types),
+                    rng.choice(categories),
+                    "".join(rng.choice(descriptions)),
+                    "".join(rng.choice(notes)),
+                    round(rng.uniform(-500, 500), 2),
+                )
+
+
+def build_years(cls, rows):
+    years = {}
+    for year, month, date, ttype, category, description, note, amount in rows:
+        if year not in years:
+            years[year] = Year(year)
+        months = years[year].months
+        if len(months) < month:
+            months.append(Month(month))
+        months[month - 1].transactions.append(
+            cls(date, ttype, category, description, amount, note)
+        )
+    return list(years.values())
+
+
+def measure(cls):
+    """
+    Return (in-memory bytes, pickled bytes) for the given transaction class.
+    Rows are generated inside the traced region so that per-row strings and
+    dates are counted against the representation that retains them.
+    """
+    tracemalloc.start()
+    years = build_years(cls, synthetic_rows())
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pickled = len(pickle.dumps(years, pickle.HIGHEST_PROTOCOL))
+    return size, pickled
+
+
+def construction_time(cls) -> float:
+    """
+    Return the time in seconds to build the synthetic decade with the given
+    transaction class, excluding generating the rows.
+    """
+    rows = list(synthetic_rows())
+    start = time.perf_counter()
+    build_years(cls, rows)
+    return time.perf_counter() - start
+
+
+def bench_transaction_memory():
+    count = len(YEARS) * MONTHS_IN_YEAR * TRANSACTIONS_PER_MONTH
+    print(f"{count} transactions over {len(YEARS)} years")
+    print(
+        f"{'':<8}{'bytes/txn (memory)':>20}{'bytes/txn (pickle)':>20}"
+        f"{'us/txn (build)':>16}"
+    )
+    for label, cls in (("before", LegacyTransaction), ("after", Transaction)):
+        size, pickled = measure(cls)
+        elapsed = construction_time(cls)
+        print(
+            f"{label:<8}{size / count:>20.1f}{pickled / count:>20.1f}"
+            f"{elapsed / count * 1e6:>16.2f}"
+        )
+
+
+# Number of rows in the synthetic bank statement.
+STATEMENT_ROWS = 200000
+
+
+def write_statement(filename: Path, rows: int, seed: int = 0):
+    """
+    Write a synthetic multi-year CSV bank statement.
+    """
+    rng = random.Random(seed)
+    codes = ["DEB", "DD", "FPI", "FPO", "SO", "BGC", "CPT", "TFR"]
+    start = datetime.date(YEARS[0], 1, 1).toordinal()
+    end = datetime.date(YEARS[-1], 12, 31).toordinal()
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["Transaction Date", "Transaction Type", "Transaction Description"]
+            + ["Debit Amount", "Credit Amount"]
+        )
+        for i in range(rows):
+            date = datetime.date.fromordinal(start + (end - start) * i // rows)
+            amount = f"{rng.uniform(1, 500):,.2f}"
+            debit = rng.random() < 0.8
+            writer.writerow(
+                [
+                    f"{date:%d/%m/%Y}",
+                    rng.choice(codes),
+                    f"PAYEE {rng.randrange(NUM_DESCRIPTIONS)}",
+                    amount if debit else "",
+                    "" if debit else amount,
+                ]
+            )
+
+
+def bench_import_statement():
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        filename = tmp / "statement.csv"
+        write_statement(filename, STATEMENT_ROWS)
+        size = filename.stat().st_size
+        print(f"{STATEMENT_ROWS} rows, {size / 1e6:.1f} MB, {len(YEARS)} years")
+        store = tmp / "timed"
+        store.mkdir()
+        start = time.perf_counter()
+        import_statement(filename, store)
+        elapsed = time.perf_counter() - start
+        print(f"import: {elapsed:.2f} s, {STATEMENT_ROWS / elapsed:,.0f} rows/s")
+        store = tmp / "traced"
+        store.mkdir()
+        tracemalloc.start()
+        import_statement(filename, store)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"peak memory: {peak / 1e6:.1f} MB (including the year being imported)")
+    finally:
+        shutil.rmtree(tmp)
+
+
+# Number of distinct descriptions categorised per rule set size.
+CATEGORISE_DESCRIPTIONS = 20000
+
+
+def bench_categorise():
+    rng = random.Random(0)
+    categories = list(Category)
+    descriptions = [
+        f"CARD PAYMENT TO MERCHANT {rng.randrange(100000):05d} ON {i % 28 + 1:02d}"
+        for i in range(CATEGORISE_DESCRIPTIONS)
+    ]
+    print(f"{CATEGORISE_DESCRIPTIONS} distinct descriptions")
+    print(f"{'rules':>8}{'descriptions/s':>18}{'matched':>10}")
+    for num_rules in (10, 100, 1000, 5000):
+        rules = RuleSet(
+            [
+                Rule(f"merchant {i:05d}", rng.choice(categories))
+                for i in rng.sample(range(100000), num_rules)
+            ]
+        )
+        start = time.perf_counter()
+        matched = sum(
+            rules.categorise(x, TransactionType.POS, -1.0) is not None
+            for x in descriptions
+        )
+        elapsed = time.perf_counter() - start
+        print(f"{num_rules:>8}{len(descriptions) / elapsed:>18,.0f}{matched:>10}")
+
+
+# Simulated Sheets request latency in seconds, and the fraction of requests
+# failing because the request quota is exceeded.
+FETCH_LATENCY = 0.005
+FETCH_QUOTA_ERROR_RATE = 0.05
+FETCH_HEADER = ["Date", "Type", "Category", "Description", "Amount", "Note"]
+# Worksheet labels of transaction types not written by their name.
+FETCH_TYPE_LABELS = {TransactionType.CASH: "ATM", TransactionType.ITF: "TFR"}
+
+
+def bench_fetch():
+    tmp = Path(tempfile.mkdtemp())
+    try:
+        tables = {
+            year: [[FETCH_HEADER] for _ in range(MONTHS_IN_YEAR)] for year in YEARS
+        }
+        for (
+            year,
+            month,
+            date,
+            ttype,
+            category,
+            description,
+            note,
+            amount,
+        ) in synthetic_rows():
+            tables[year][month - 1].append(
+                [
+                    f"{date:%Y-%m-%d}",
+                    FETCH_TYPE_LABELS.get(ttype, ttype.name),
+                    category.name.lower().replace("_", " "),
+                    description,
+                    f"{amount:.2f}",
+                    note,
+                ]
+            )
+        sheets = {year: Sheet(f"Spending-{year}", read_worksheet) for year in YEARS}
+        for year in YEARS:
+            record_spreadsheet(tmp, sheets[year].name, f"{year}-12-31", tables[year])
+        rows = len(YEARS) * MONTHS_IN_YEAR * TRANSACTIONS_PER_MONTH
+        print(
+            f"{len(YEARS)} years, {rows} rows, {FETCH_LATENCY * 1000:.0f} ms latency, "
+            f"{FETCH_QUOTA_ERROR_RATE:.0%} quota errors"
+        )
+        client = ReplayClient(tmp, FETCH_LATENCY, FETCH_QUOTA_ERROR_RATE)
+        start = time.perf_counter()
+        with mock.patch("main.FETCH_BACKOFF", FETCH_LATENCY):
+            fetched = {year: fetch_tables(year, sheets, client) for year in YEARS}
+        elapsed = time.perf_counter() - start
+        print(
+            f"fetch: {elapsed:.2f} s, {client.num_requests} requests, "
+            f"{client.num_quota_errors} quota errors"
+        )
+        start = time.perf_counter()
+        years = parse_years(fetched, jobs=1, sheets=sheets)
+        elapsed = time.perf_counter() - start
+        parsed = sum(m.num_transactions() for y in years for m in y.months)
+        print(f"parse: {elapsed:.2f} s, {parsed / elapsed:,.0f} rows/s")
+        if parsed != rows:
+            raise RuntimeError(f"Parsed {parsed} of {rows} rows")
+    finally:
+        shutil.rmtree(tmp)
+
+
+BENCHMARKS = {
+    "transaction-memory": bench_transaction_memory,
+    "import-statement": bench_import_statement,
+    "categorise": bench_categorise,
+    "fetch": bench_fetch,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "benchmark",
+        nargs="*",
+        help=f"Benchmarks to run: {', '.join(BENCHMARKS)} (default: all)",
+    )
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+    for name in args.benchmark or BENCHMARKS.keys():
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,106 @@
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+from jinja2 import Environment, FileSystemLoader
+from pathlib import Path
+import json
+import logging
+
+# Validation rules.
+SKIPPED_ROW = "skipped-row"
+UNKNOWN_CATEGORY = "unknown-category"
+UNKNOWN_TRANSACTION_TYPE = "unknown-transaction-type"
+YEAR_OUT_OF_RANGE = "year-out-of-range"
+MONTH_OUT_OF_RANGE = "month-out-of-range"
+
+
+@dataclass(slots=True)
+class Issue:
+    """
+    A class to represent a single validation issue. The raw value is kept as
+    it was found (a cell, a row or a date) and only formatted for output.
+    """
+
+    sheet: str
+    month: int
+    row: int
+    rule: str
+    value: Any
+
+    def value_str(self) -> str:
+        if isinstance(self.value, (list, tuple)):
+            return ", ".join(str(x) for x in self.value)
+        return str(self.value)
+
+    def to_dict(self) -> dict:
+        return dict(
+            sheet=self.sheet,
+            month=self.month,
+            row=self.row,
+            rule=self.rule,
+            value=self.value_str(),
+        )
+
+
+class Diagnostics:
+    """
+    A class to collect validation issues raised while parsing worksheets.
+    """
+
+    issues: List[Issue]
+
+    def __init__(self):
+        self.issues = []
+
+    def add(self, sheet: str, month: int, row: int, rule: str, value: Any):
+        """
+        Record an issue. Nothing is formatted unless debug logging is enabled.
+        """
+        issue = Issue(sheet, month, row, rule, value)
+        self.issues.append(issue)
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(
+                f"{sheet} month {month} row {row}: {rule}: {issue.value_str()}"
+            )
+
+    def extend(self, other: "Diagnostics"):
+        self.issues.extend(other.issues)
+
+    def num_issues(self) -> int:
+        return len(self.issues)
+
+    def count_by_rule(self) -> Dict[str, int]:
+        return dict(Counter(x.rule for x in self.issues))
+
+    def count_by_sheet(self) -> Dict[str, int]:
+        return dict(Counter(x.sheet for x in self.issues))
+
+    def report(self):
+        """
+        Log a summary of the issues recorded.
+        """
+        if not self.issues:
+            logging.info("Validation: no issues")
+            return
+        logging.warning(f"Validation: {self.num_issues()} issues")
+        for rule, count in sorted(self.count_by_rule().items()):
+            logging.warning(f"  {rule}: {count}")
+        for sheet, count in sorted(self.count_by_sheet().items()):
+            logging.warning(f"  {sheet}: {count}")
+
+    def write_json(self, filename: Path):
+        with open(filename, mode="w", encoding="utf-8") as f:
+            json.dump([x.to_dict() for x in self.issues], f, indent=1)
+            logging.info(f"Wrote {filename}")
+
+    def write_html(
+        self, filename: Path, all_years: Optional[list] = None, root: str = ""
+    ):
+        environment = Environment(loader=FileSystemLoader("templates/"))
+        template = environment.get_template("diagnostics.html")
+        content = template.render(
+            all_years=all_years or [], root=root, diagnostics=self
+        )
+        with open(filename, mode="w", encoding="utf-8") as f:
+            f.write(content)
+            logging.info(f"Wrote {filename}")
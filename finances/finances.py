@@ -1,14 +1,16 @@
 from collections import defaultdict
 from dataclasses import dataclass
 from enum import Enum
-from rich import print
-from tabulate import tabulate
-from typing import List, Dict
+from itertools import accumulate
+from typing import Dict, List, Optional, Set, Tuple
 import datetime
+import json
 import logging
 from jinja2 import Environment, FileSystemLoader
+from finances.search import SHARD_PREFIX_LENGTH, write_search_index
 from pathlib import Path
 import shutil
+import sys
 
 MONTHS_IN_YEAR = 12
 
@@ -62,10 +64,16 @@ class Category(Enum):
         return str(self.value)
 
 
-@dataclass
+@dataclass(slots=True)
 class Transaction:
     """
     A class to represent a single transaction.
+
+    Instances are slotted to avoid a per-row __dict__, descriptions and notes
+    are interned so repeated strings are shared between rows, and dates are
+    stored as plain dates (any time component is discarded). auto_category is
+    set when the category was assigned by the categorisation rules or by
+    default, rather than given in the source.
     """
 
     date: datetime.date
@@ -74,6 +82,28 @@ class Transaction:
     description: str
     amount: float
     note: str
+    auto_category: bool = False
+
+    def __post_init__(self):
+        if isinstance(self.date, datetime.datetime):
+            self.date = self.date.date()
+        self.description = sys.intern(self.description)
+        self.note = sys.intern(self.note)
+
+    def __getstate__(self) -> dict:
+        # Pickle the fields as a dict, the same as a regular dataclass, so
+        # pickle files remain readable in both directions.
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        if isinstance(state, tuple):
+            # (dict state, slot state) as produced for slotted objects.
+            state = {**(state[0] or {}), **(state[1] or {})}
+        # Pickles written before auto_category was added have no value for it.
+        state = {"auto_category": False, **state}
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.__post_init__()
 
     def __str__(self):
         return f"{self.date:%d-%m-%Y} {self.transaction_type} {self.category} {self.amount} {self.description} {self.note}"
@@ -94,23 +124,6 @@ class Month:
     def num_transactions(self) -> int:
         return len(self.transactions)
 
-    def report_transactions(self):
-        headers = ["Date", "Type", "Category", "Description", "Amount", "Note"]
-        table = []
-        for t in self.transactions:
-            table.append(
-                [
-                    f"{t.date:%d-%m-%Y}",
-                    t.transaction_type.name,
-                    t.category.name,
-                    t.description,
-                    t.amount,
-                    t.note,
-                ]
-            )
-        print()
-        print(tabulate(table, headers, tablefmt="simple_outline"))
-
     def total_amount(self, category: Category) -> float:
         """
         Return the total amount in a given category of transaction.
@@ -173,6 +186,135 @@ class MonthInYear(Enum):
     Dec = 12
 
 
+class Trends:
+    """
+    A class to hold monthly totals by category over all years, as a dense
+    (month x category) matrix, and the time series derived from it.
+
+    The matrix is built in one pass over the transactions. Everything else is
+    computed from the matrix and its prefix sums, so its cost depends on the
+    number of months rather than the number of transactions.
+    """
+
+    labels: List[str]
+    categories: List[Category]
+    matrix: List[List[float]]
+
+    def __init__(self, years: List[Year]):
+        self.categories = list(Category)
+        self.labels = []
+        self.matrix = []
+        self._prefix = [[0.0] for _ in self.categories]
+        years = [x for x in years if x.months]
+        if not years:
+            return
+        first = min(x.index for x in years)
+        last = max(years, key=lambda x: x.index)
+        # Calendar months from the first year to the last month with data.
+        num_months = (last.index - first) * MONTHS_IN_YEAR + max(
+            x.index for x in last.months
+        )
+        self.labels = [
+            f"{MonthInYear(i % MONTHS_IN_YEAR + 1).name} {first + i // MONTHS_IN_YEAR}"
+            for i in range(num_months)
+        ]
+        self.matrix = [[0.0] * len(self.categories) for _ in range(num_months)]
+        column = {category: i for i, category in enumerate(self.categories)}
+        for year in years:
+            for month in year.months:
+                row = self.matrix[
+                    (year.index - first) * MONTHS_IN_YEAR + month.index - 1
+                ]
+                for t in month.transactions:
+                    row[column[t.category]] += t.amount
+        # Prefix sums of each category column, with a leading zero.
+        self._prefix = [
+            [0.0] + list(accumulate(row[i] for row in self.matrix))
+            for i in range(len(self.categories))
+        ]
+
+    def num_months(self) -> int:
+        return len(self.matrix)
+
+    def series(self, category: Category) -> List[float]:
+        """
+        Return the monthly totals of a category.
+        """
+        i = self.categories.index(category)
+        return [row[i] for row in self.matrix]
+
+    def balance(self) -> List[float]:
+        """
+        Return the cumulative balance at the end of each month.
+        """
+        return list(accumulate(sum(row) for row in self.matrix))
+
+    def rolling_average(self, category: Category, window: int) -> List[Optional[float]]:
+        """
+        Return the average monthly total of a category over a sliding window
+        ending at each month, or None where the window is incomplete.
+        """
+        prefix = self._prefix[self.categories.index(category)]
+        return [
+            (prefix[i + 1] - prefix[i + 1 - window]) / window
+            if i + 1 >= window
+            else None
+            for i in range(self.num_months())
+        ]
+
+    def year_on_year(self, category: Category) -> List[Optional[float]]:
+        """
+        Return the change in the monthly total of a category from the same
+        month in the previous year, or None in the first year.
+        """
+        values = self.series(category)
+        return [
+            values[i] - values[i - MONTHS_IN_YEAR] if i >= MONTHS_IN_YEAR else None
+            for i in range(len(values))
+        ]
+
+
+# Web assets copied into the output directory, shared by all datasets.
+WEB_DIRS = ["static"]
+WEB_FILES = ["static/js/sorttable.js", "output/bundle.js"]
+
+# Name of the file caching a dataset's category totals by year, so the
+# consolidated summary can be rendered without loading an unchanged dataset.
+SUMMARY = "summary.json"
+
+
+def copy_web_dirs(output_dir: Path):
+    """
+    Copy directories into the output directory.
+    """
+    for d in WEB_DIRS:
+        src_path = Path(d)
+        if not src_path.exists():
+            raise RuntimeError(f"Directory {d} does not exist")
+        if src_path != output_dir:
+            shutil.copytree(src_path, output_dir, dirs_exist_ok=True)
+            logging.info(f"Copied {src_path} to {output_dir}")
+
+
+def copy_web_files(output_dir: Path):
+    """
+    Copy files into the output directory.
+    """
+    for f in WEB_FILES:
+        src_path = Path(f)
+        if not src_path.exists():
+            raise RuntimeError(f"File {f} does not exist")
+        dst_path = output_dir / src_path.name
+        if src_path != dst_path:
+            shutil.copyfile(src_path, dst_path)
+            logging.info(f"Copied {src_path} to {dst_path}")
+
+
+def copy_web_assets(output_dir: Path):
+    copy_web_dirs(output_dir)
+    copy_web_files(output_dir)
+
+
 @dataclass
 class Finances:
     """
@@ -180,18 +322,52 @@ class Finances:
     """
 
     years: List[Year]
-
-    DIRS = ["static"]
-    FILES = ["static/js/sorttable.js", "output/bundle.js"]
+    name: str = ""
+    title: str = "Finances"
 
     def create_html_report(self, output_dir: Path):
         self.render_html(output_dir)
-        self.copy_web_dirs(output_dir)
-        self.copy_web_files(output_dir)
+        copy_web_assets(output_dir)
 
-    def render_html(self, output_dir: Path):
-        environment = Environment(loader=FileSystemLoader("templates/"))
-        shared = dict(months=MonthInYear, categories=Category, all_years=self.years)
+    def category_totals(self) -> Dict[int, Dict[str, float]]:
+        """
+        Return the total amount in each category by year, computed in a single
+        pass. The balance of a year is the sum of its totals.
+        """
+        totals = {}
+        for year in self.years:
+            year_totals = totals[year.index] = {}
+            for month in year.months:
+                for t in month.transactions:
+                    name = t.category.name
+                    year_totals[name] = year_totals.get(name, 0.0) + t.amount
+        return totals
+
+    def render_html(
+        self,
+        output_dir: Path,
+        environment: Optional[Environment] = None,
+        root: str = "",
+        changed: Optional[Set[Tuple[int, int]]] = None,
+    ):
+        """
+        Render the pages. The environment may be shared between datasets, and
+        root is the relative path from the output directory to shared assets.
+        If the set of changed (year, month) pairs is given, only the pages
+        that depend on them are rendered.
+        """
+        if changed is not None and not changed:
+            logging.info(f"No changes to {self.title}, skipping")
+            return
+        if environment is None:
+            environment = Environment(loader=FileSystemLoader("templates/"))
+        shared = dict(
+            months=MonthInYear,
+            categories=Category,
+            all_years=self.years,
+            root=root,
+            title=self.title,
+        )
 
         template = environment.get_template("index.html")
         content = template.render(**shared, dataset=self)
@@ -201,10 +377,14 @@ class Finances:
             logging.info(f"Wrote {filename}")
 
         # Year pages
+        changed_years = None if changed is None else {x[0] for x in changed}
         year_template = environment.get_template("year.html")
         for year in self.years:
-            content = year_template.render(**shared, year=year)
             filename = output_dir / f"year-{year.index}.html"
+            if changed_years is not None and year.index not in changed_years:
+                if filename.exists():
+                    continue
+            content = year_template.render(**shared, year=year)
             with open(filename, mode="w", encoding="utf-8") as f:
                 f.write(content)
                 logging.info(f"Wrote {filename}")
@@ -213,38 +393,110 @@ class Finances:
         month_template = environment.get_template("month.html")
         for year in self.years:
             for month in year.months:
+                filename = output_dir / f"transactions-{month.index}-{year.index}.html"
+                if changed is not None and (year.index, month.index) not in changed:
+                    if filename.exists():
+                        continue
                 content = month_template.render(
                     **shared,
                     year=year.index,
                     month=month.index,
                     dataset=month,
                 )
-                filename = output_dir / f"transactions-{month.index}-{year.index}.html"
                 with open(filename, mode="w", encoding="utf-8") as f:
                     f.write(content)
                     logging.info(f"Wrote {filename}")
 
-    def copy_web_dirs(self, output_dir: Path):
-        """
-        Copy directories into the output directory.
-        """
-        for d in self.DIRS:
-            src_path = Path(d)
-            if not src_path.exists():
-                raise RuntimeError(f"Directory {d} does not exist")
-            if src_path != output_dir:
-                shutil.copytree(src_path, output_dir, dirs_exist_ok=True)
-                logging.info(f"Copied {src_path} to {output_dir}")
+        # Trends page
+        trends_template = environment.get_template("trends.html")
+        content = trends_template.render(**shared, trends=Trends(self.years))
+        filename = output_dir / "trends.html"
+        with open(filename, mode="w", encoding="utf-8") as f:
+            f.write(content)
+            logging.info(f"Wrote {filename}")
 
-    def copy_web_files(self, output_dir: Path):
+        # Search page and index
+        shards = write_search_index(self.years, output_dir)
+        search_template = environment.get_template("search.html")
+        content = search_template.render(
+            **shared, shards=shards, prefix_length=SHARD_PREFIX_LENGTH
+        )
+        filename = output_dir / "search.html"
+        with open(filename, mode="w", encoding="utf-8") as f:
+            f.write(content)
+            logging.info(f"Wrote {filename}")
+
+
+@dataclass
+class Datasets:
+    """
+    A class to hold several named finance datasets, such as accounts or
+    households, that are rendered together. Each dataset is rendered into a
+    subdirectory named after it, with a consolidated summary page, the
+    template environment and the web assets shared between them.
+    """
+
+    datasets: List[Finances]
+
+    def create_html_report(
+        self,
+        output_dir: Path,
+        changed: Optional[Dict[str, Optional[Set[Tuple[int, int]]]]] = None,
+    ):
+        self.render_html(output_dir, changed)
+        copy_web_assets(output_dir)
+
+    def render_html(
+        self,
+        output_dir: Path,
+        changed: Optional[Dict[str, Optional[Set[Tuple[int, int]]]]] = None,
+    ):
         """
-        Copy files into the output directory.
+        Render each dataset and the consolidated summary page. If the changed
+        months of each dataset are given, only the pages depending on them are
+        rendered, and a dataset with no changes is not rendered at all (its
+        years need not be loaded): its category totals are read from the
+        summary written when it was last rendered.
         """
-        for f in self.FILES:
-            src_path = Path(f)
-            if not src_path.exists():
-                raise RuntimeError(f"File {f} does not exist")
-            dst_path = output_dir / src_path.name
-            if src_path != dst_path:
-                shutil.copyfile(src_path, dst_path)
-                logging.info(f"Copied {src_path} to {dst_path}")
+        environment = Environment(loader=FileSystemLoader("templates/"))
+        summaries = []
+        for dataset in self.datasets:
+            dataset_dir = output_dir / dataset.name
+            dataset_dir.mkdir(exist_ok=True)
+            dataset_changed = None if changed is None else changed.get(dataset.name)
+            dataset.render_html(
+                dataset_dir,
+                environment,
+                root="../" if dataset.name else "",
+                changed=dataset_changed,
+            )
+            summary_file = dataset_dir / SUMMARY
+            if dataset_changed is not None and not dataset_changed:
+                with open(summary_file, encoding="utf-8") as f:
+                    totals = {int(k): v for k, v in json.load(f).items()}
+            else:
+                totals = dataset.category_totals()
+                with open(summary_file, mode="w", encoding="utf-8") as f:
+                    json.dump(totals, f)
+            summaries.append((dataset, totals))
+        if len(self.datasets) == 1 and not self.datasets[0].name:
+            # A single unnamed dataset is rendered into the output directory
+            # itself, so there is nothing to consolidate.
+            return
+        consolidated = {}
+        for _, totals in summaries:
+            for year, year_totals in totals.items():
+                all_totals = consolidated.setdefault(year, {})
+                for name, amount in year_totals.items():
+                    all_totals[name] = all_totals.get(name, 0.0) + amount
+        template = environment.get_template("consolidated.html")
+        content = template.render(
+            categories=Category,
+            years=sorted(consolidated),
+            datasets=summaries,
+            consolidated=consolidated,
+        )
+        filename = output_dir / "index.html"
+        with open(filename, mode="w", encoding="utf-8") as f:
+            f.write(content)
+            logging.info(f"Wrote {filename}")
@@ -0,0 +1,200 @@
+from dataclasses import dataclass
+from finances.finances import Category, Month, Transaction, TransactionType, Year
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import datetime
+import json
+import logging
+
+# Name of the journal file in the output directory.
+JOURNAL = "journal.jsonl"
+
+ADDED = "added"
+REMOVED = "removed"
+MODIFIED = "modified"
+
+
+@dataclass(slots=True)
+class Change:
+    """
+    A class to represent a change to one transaction between two versions of
+    a month. Added transactions have no previous value, and removed
+    transactions no current value.
+    """
+
+    year: int
+    month: int
+    change: str
+    key: tuple
+    transaction: Optional[Transaction]
+    previous: Optional[Transaction]
+    imported: bool = False
+
+    def to_dict(self) -> dict:
+        d = dict(
+            year=self.year,
+            month=self.month,
+            change=self.change,
+            key=[str(x) if isinstance(x, datetime.date) else x for x in self.key],
+        )
+        if self.imported:
+            # The transaction is kept in the year's imported transaction file,
+            # so it is only referred to by its key.
+            d["imported"] = True
+        else:
+            d["transaction"] = transaction_to_dict(self.transaction)
+            d["previous"] = transaction_to_dict(self.previous)
+        return d
+
+
+def transaction_to_dict(t: Optional[Transaction]) -> Optional[dict]:
+    if t is None:
+        return None
+    return dict(
+        date=str(t.date),
+        transaction_type=t.transaction_type.name,
+        category=t.category.name,
+        description=t.description,
+        amount=t.amount,
+        note=t.note,
+        auto_category=t.auto_category,
+    )
+
+
+def transaction_from_dict(d: dict) -> Transaction:
+    return Transaction(
+        datetime.date.fromisoformat(d["date"]),
+        TransactionType[d["transaction_type"]],
+        Category[d["category"]],
+        d["description"],
+        d["amount"],
+        d["note"],
+        d.get("auto_category", False),
+    )
+
+
+def normalise(description: str) -> str:
+    return " ".join(description.lower().split())
+
+
+def transaction_keys(month: Optional[Month]) -> Dict[tuple, Transaction]:
+    """
+    Return the transactions of a month by a stable key of date, type, amount,
+    normalised description and the occurrence of that combination within the
+    month.
+    """
+    keys = {}
+    if month is None:
+        return keys
+    occurrences = {}
+    for t in month.transactions:
+        base = (t.date, t.transaction_type.name, t.amount, normalise(t.description))
+        n = occurrences.get(base, 0)
+        occurrences[base] = n + 1
+        keys[base + (n,)] = t
+    return keys
+
+
+def diff_months(
+    year_index: int, month_index: int, old: Optional[Month], new: Optional[Month]
+) -> List[Change]:
+    """
+    Return the changes between two versions of a month. A transaction with the
+    same key in both is modified if its category, description or note differ.
+    """
+    old_keys = transaction_keys(old)
+    new_keys = transaction_keys(new)
+    changes = []
+    for key, t in new_keys.items():
+        previous = old_keys.get(key)
+        if previous is None:
+            changes.append(Change(year_index, month_index, ADDED, key, t, None))
+        elif (t.category, t.description, t.note) != (
+            previous.category,
+            previous.description,
+            previous.note,
+        ):
+            changes.append(Change(year_index, month_index, MODIFIED, key, t, previous))
+    for key, previous in old_keys.items():
+        if key not in new_keys:
+            changes.append(
+                Change(year_index, month_index, REMOVED, key, None, previous)
+            )
+    return changes
+
+
+def diff_years(old: Year, new: Year) -> List[Change]:
+    """
+    Return the changes between two versions of a year, matching months by index.
+    """
+    old_months = {x.index: x for x in old.months}
+    new_months = {x.index: x for x in new.months}
+    changes = []
+    for index in sorted(old_months.keys() | new_months.keys()):
+        changes.extend(
+            diff_months(new.index, index, old_months.get(index), new_months.get(index))
+        )
+    return changes
+
+
+def imported_changes(year: Year, transactions: List[Transaction]) -> List[Change]:
+    """
+    Return the changes recording transactions imported into a year, keyed as
+    diff_years would key them, without comparing against the stored year. The
+    transactions must have been appended to the year's months.
+    """
+    imported = {id(x) for x in transactions}
+    months = {x.date.month for x in transactions}
+    changes = []
+    for month in year.months:
+        if month.index not in months:
+            continue
+        for key, t in transaction_keys(month).items():
+            if id(t) in imported:
+                changes.append(
+                    Change(year.index, month.index, ADDED, key, t, None, True)
+                )
+    return changes
+
+
+def append_journal(output_dir: Path, changes: List[Change]):
+    """
+    Append changes to the journal, stamped with the current time.
+    """
+    if not changes:
+        return
+    filename = output_dir / JOURNAL
+    time = datetime.datetime.now().isoformat(timespec="seconds")
+    with open(filename, mode="a", encoding="utf-8") as f:
+        for change in changes:
+            f.write(json.dumps(dict(time=time, **change.to_dict())) + "\n")
+    logging.info(f"Appended {len(changes)} changes to {filename}")
+
+
+def read_journal(output_dir: Path, since: Optional[str] = None) -> Iterator[dict]:
+    """
+    Yield journal entries, optionally only those recorded at or after a time
+    (an ISO format string, as written in the journal).
+    """
+    filename = output_dir / JOURNAL
+    if not filename.exists():
+        return
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if since is None or entry["time"] >= since:
+                yield entry
+
+
+def changed_months(entries) -> Set[Tuple[int, int]]:
+    """
+    Return the (year, month) pairs touched by a sequence of journal entries.
+    """
+    return {(x["year"], x["month"]) for x in entries}
+
+
+def summarise(changes: List[Change]) -> Dict[str, int]:
+    counts = {ADDED: 0, REMOVED: 0, MODIFIED: 0}
+    for change in changes:
+        counts[change.change] += 1
+    return counts
@@ -0,0 +1,191 @@
+from gspread.exceptions import APIError, GSpreadException, SpreadsheetNotFound
+from pathlib import Path
+from typing import List, Optional
+import json
+import logging
+import random
+import re
+import time
+
+# Metadata of a recorded spreadsheet, alongside one file per worksheet.
+SPREADSHEET = "spreadsheet.json"
+
+# HTTP status of a Sheets API error when a request quota is exceeded.
+QUOTA_EXCEEDED = 429
+
+
+def spreadsheet_dir(directory: Path, name: str) -> Path:
+    return directory / re.sub(r"[^\w.-]+", "_", name)
+
+
+def worksheet_file(directory: Path, index: int) -> Path:
+    return directory / f"worksheet-{index}.json"
+
+
+def write_recording(filename: Path, data):
+    filename.parent.mkdir(parents=True, exist_ok=True)
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+        logging.info(f"Wrote {filename}")
+
+
+def record_spreadsheet(
+    directory: Path, name: str, last_update_time: str, tables: List[list]
+):
+    """
+    Write a recording of a spreadsheet with the given worksheet tables, as if
+    it had been fetched through a RecordingClient.
+    """
+    path = spreadsheet_dir(directory, name)
+    metadata = dict(name=name, last_update_time=last_update_time)
+    metadata["worksheets"] = len(tables)
+    write_recording(path / SPREADSHEET, metadata)
+    for index, table in enumerate(tables):
+        write_recording(worksheet_file(path, index), table)
+
+
+class QuotaExceeded(APIError):
+    """
+    The error raised by gspread when the request quota is exceeded, replayed
+    without an HTTP response.
+    """
+
+    def __init__(self):
+        error = {
+            "code": QUOTA_EXCEEDED,
+            "message": "Quota exceeded (replayed)",
+            "status": "RESOURCE_EXHAUSTED",
+        }
+        GSpreadException.__init__(self, error)
+        self.response = None
+        self.error = error
+        self.code = QUOTA_EXCEEDED
+
+    def __reduce__(self) -> tuple:
+        return self.__class__, ()
+
+
+class RecordingWorksheet:
+    def __init__(self, worksheet, path: Path, index: int):
+        self.worksheet = worksheet
+        self.path = path
+        self.index = index
+
+    def get_all_values(self) -> list:
+        values = self.worksheet.get_all_values()
+        write_recording(worksheet_file(self.path, self.index), values)
+        return values
+
+
+class RecordingSpreadsheet:
+    def __init__(self, spreadsheet, path: Path, name: str):
+        self.spreadsheet = spreadsheet
+        self.path = path
+        self.metadata = dict(name=name, last_update_time=None, worksheets=0)
+
+    def get_lastUpdateTime(self) -> str:
+        self.metadata["last_update_time"] = self.spreadsheet.get_lastUpdateTime()
+        write_recording(self.path / SPREADSHEET, self.metadata)
+        return self.metadata["last_update_time"]
+
+    def worksheets(self) -> list:
+        worksheets = self.spreadsheet.worksheets()
+        self.metadata["worksheets"] = len(worksheets)
+        write_recording(self.path / SPREADSHEET, self.metadata)
+        return worksheets
+
+    def get_worksheet(self, index: int) -> RecordingWorksheet:
+        worksheet = self.spreadsheet.get_worksheet(index)
+        return RecordingWorksheet(worksheet, self.path, index)
+
+
+class RecordingClient:
+    """
+    A stand-in for a gspread client that passes requests through to a real
+    client and records the responses used by fetching in a directory, with a
+    subdirectory per spreadsheet, so they can be replayed by a ReplayClient.
+    """
+
+    def __init__(self, client, directory: Path):
+        self.client = client
+        self.directory = directory
+
+    def open(self, name: str) -> RecordingSpreadsheet:
+        spreadsheet = self.client.open(name)
+        return RecordingSpreadsheet(
+            spreadsheet, spreadsheet_dir(self.directory, name), name
+        )
+
+
+class ReplayWorksheet:
+    def __init__(self, client: "ReplayClient", path: Path, index: int):
+        self.client = client
+        self.path = path
+        self.index = index
+
+    def get_all_values(self) -> list:
+        self.client.request()
+        with open(worksheet_file(self.path, self.index), encoding="utf-8") as f:
+            return json.load(f)
+
+
+class ReplaySpreadsheet:
+    def __init__(self, client: "ReplayClient", path: Path, metadata: dict):
+        self.client = client
+        self.path = path
+        self.metadata = metadata
+
+    def get_lastUpdateTime(self) -> str:
+        self.client.request()
+        return self.metadata["last_update_time"]
+
+    def worksheets(self) -> List[ReplayWorksheet]:
+        self.client.request()
+        return [
+            ReplayWorksheet(self.client, self.path, i)
+            for i in range(self.metadata["worksheets"])
+        ]
+
+    def get_worksheet(self, index: int) -> ReplayWorksheet:
+        self.client.request()
+        return ReplayWorksheet(self.client, self.path, index)
+
+
+class ReplayClient:
+    """
+    A stand-in for a gspread client that replays recorded responses without
+    network access. Each request waits for the given latency in seconds and,
+    with the given probability, fails as if the request quota were exceeded.
+    Errors are drawn from a seeded generator, so a replay is deterministic.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        latency: float = 0.0,
+        quota_error_rate: float = 0.0,
+        seed: Optional[int] = 0,
+    ):
+        self.directory = directory
+        self.latency = latency
+        self.quota_error_rate = quota_error_rate
+        self.random = random.Random(seed)
+        self.num_requests = 0
+        self.num_quota_errors = 0
+
+    def request(self):
+        self.num_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.quota_error_rate and self.random.random() < self.quota_error_rate:
+            self.num_quota_errors += 1
+            raise QuotaExceeded()
+
+    def open(self, name: str) -> ReplaySpreadsheet:
+        self.request()
+        path = spreadsheet_dir(self.directory, name)
+        if not (path / SPREADSHEET).exists():
+            raise SpreadsheetNotFound(name)
+        with open(path / SPREADSHEET, encoding="utf-8") as f:
+            metadata = json.load(f)
+        return ReplaySpreadsheet(self, path, metadata)
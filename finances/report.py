@@ -0,0 +1,145 @@
+from finances.finances import Category, Transaction, Year
+from tabulate import tabulate
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List
+from typing import Optional, Tuple
+from io import TextIOBase
+import datetime
+import itertools
+import json
+import sys
+
+# A transaction with the indices of its year and month.
+Row = Tuple[int, int, Transaction]
+
+# Value of each report column for a row.
+COLUMNS: Dict[str, Callable[[Row], Any]] = {
+    "year": lambda row: row[0],
+    "month": lambda row: row[1],
+    "date": lambda row: row[2].date,
+    "type": lambda row: row[2].transaction_type.name,
+    "category": lambda row: row[2].category.name,
+    "description": lambda row: row[2].description,
+    "amount": lambda row: row[2].amount,
+    "note": lambda row: row[2].note,
+}
+
+DEFAULT_COLUMNS = ["date", "type", "category", "description", "amount", "note"]
+
+# Columns transactions can be grouped by in a summary.
+GROUP_COLUMNS = ["year", "month", "category", "type"]
+
+TABLE = "table"
+TSV = "tsv"
+JSONL = "jsonl"
+FORMATS = [TABLE, TSV, JSONL]
+
+# Number of rows formatted and written at a time.
+PAGE_SIZE = 50
+
+
+def iter_rows(
+    years: Iterable[Year],
+    months: Optional[Collection[int]] = None,
+    categories: Optional[Collection[Category]] = None,
+) -> Iterator[Row]:
+    """
+    Yield the transactions of each year in turn, optionally only those in the
+    given months and categories. Years may be loaded lazily by the caller.
+    """
+    for year in years:
+        for month in year.months:
+            if months and month.index not in months:
+                continue
+            for t in month.transactions:
+                if categories and t.category not in categories:
+                    continue
+                yield year.index, month.index, t
+
+
+def select_columns(rows: Iterable[Row], columns: List[str]) -> Iterator[list]:
+    getters = [COLUMNS[x] for x in columns]
+    for row in rows:
+        yield [get(row) for get in getters]
+
+
+def summarise(rows: Iterable[Row], group_by: List[str]) -> Tuple[List[str], List[list]]:
+    """
+    Return the headers and rows of a summary of the number and total amount of
+    transactions in each group, computed in a single pass.
+    """
+    getters = [COLUMNS[x] for x in group_by]
+    groups = {}
+    for row in rows:
+        key = tuple(get(row) for get in getters)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = [0, 0.0]
+        group[0] += 1
+        group[1] += row[2].amount
+    headers = group_by + ["count", "total"]
+    return headers, [list(key) + group for key, group in sorted(groups.items())]
+
+
+def format_value(value: Any) -> Any:
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+def write_table(pages: Iterator[List[list]], headers: List[str], stream: TextIOBase):
+    for page in pages:
+        table = [
+            [f"{x:%d-%m-%Y}" if isinstance(x, datetime.date) else x for x in row]
+            for row in page
+        ]
+        stream.write(
+            tabulate(table, headers, tablefmt="simple_outline", floatfmt=".2f")
+        )
+        stream.write("\n")
+        stream.flush()
+
+
+def write_tsv(pages: Iterator[List[list]], headers: List[str], stream: TextIOBase):
+    stream.write("\t".join(headers) + "\n")
+    for page in pages:
+        for row in page:
+            fields = (str(format_value(x)) for x in row)
+            stream.write("\t".join(x.replace("\t", " ") for x in fields) + "\n")
+        stream.flush()
+
+
+def write_jsonl(pages: Iterator[List[list]], headers: List[str], stream: TextIOBase):
+    for page in pages:
+        for row in page:
+            entry = dict(zip(headers, (format_value(x) for x in row)))
+            stream.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        stream.flush()
+
+
+WRITERS = {TABLE: write_table, TSV: write_tsv, JSONL: write_jsonl}
+
+
+def write_report(
+    rows: Iterable[list],
+    headers: List[str],
+    fmt: str = TABLE,
+    stream: Optional[TextIOBase] = None,
+    page_size: int = PAGE_SIZE,
+) -> int:
+    """
+    Write rows to a stream (standard output by default) a page at a time, so
+    the first page appears as soon as it has been read. Tables are formatted
+    per page; TSV and JSONL are flushed per page. Return the number of rows.
+    """
+    stream = sys.stdout if stream is None else stream
+    count = 0
+
+    def pages():
+        nonlocal count
+        it = iter(rows)
+        while page := list(itertools.islice(it, page_size)):
+            count += len(page)
+            yield page
+
+    WRITERS[fmt](pages(), headers, stream)
+    return count
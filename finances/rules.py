@@ -0,0 +1,182 @@
+from collections import deque
+from dataclasses import dataclass
+from finances.finances import Category, Transaction, TransactionType, Year
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+
+
+@dataclass(slots=True)
+class Rule:
+    """
+    A class to represent a categorisation rule. A rule matches a transaction
+    whose description contains the pattern (ignoring case) and, optionally,
+    whose type and amount match.
+    """
+
+    pattern: str
+    category: Category
+    transaction_type: Optional[TransactionType] = None
+    min_amount: Optional[float] = None
+    max_amount: Optional[float] = None
+
+    def accepts(
+        self, transaction_type: TransactionType, amount: Optional[float]
+    ) -> bool:
+        if self.transaction_type is not None:
+            if transaction_type != self.transaction_type:
+                return False
+        if self.min_amount is not None:
+            if amount is None or amount < self.min_amount:
+                return False
+        if self.max_amount is not None:
+            if amount is None or amount > self.max_amount:
+                return False
+        return True
+
+
+class RuleSet:
+    """
+    A class to assign categories to transactions from an ordered list of
+    rules, where the first matching rule wins.
+
+    All rule patterns are compiled into a single Aho-Corasick automaton, so a
+    description is scanned once regardless of the number of rules, and the
+    matches for each distinct description are memoised.
+    """
+
+    rules: List[Rule]
+
+    def __init__(self, rules: List[Rule]):
+        self.rules = rules
+        self._build()
+
+    def _build(self):
+        # Trie transitions, failure links and the rules ending at each node.
+        goto = [{}]
+        output = [[]]
+        for i, rule in enumerate(self.rules):
+            if not rule.pattern:
+                raise ValueError(f"Rule {i} has an empty pattern")
+            node = 0
+            for ch in rule.pattern.lower():
+                if ch not in goto[node]:
+                    goto[node][ch] = len(goto)
+                    goto.append({})
+                    output.append([])
+                node = goto[node][ch]
+            output[node].append(i)
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[child] = goto[f].get(ch, 0) if goto[f].get(ch) != child else 0
+                output[child] += output[fail[child]]
+        self._goto = goto
+        self._fail = fail
+        self._output = [tuple(sorted(set(x))) for x in output]
+        self._matches = {}
+
+    def __getstate__(self) -> dict:
+        # Only the rules are pickled; the automaton is rebuilt on load.
+        return {"rules": self.rules}
+
+    def __setstate__(self, state: dict):
+        self.rules = state["rules"]
+        self._build()
+
+    def matches(self, description: str) -> Tuple[int, ...]:
+        """
+        Return the indices of the rules whose patterns occur in a description,
+        in rule order.
+        """
+        found = self._matches.get(description)
+        if found is not None:
+            return found
+        goto, fail, output = self._goto, self._fail, self._output
+        indices = set()
+        node = 0
+        for ch in description.lower():
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if output[node]:
+                indices.update(output[node])
+        found = tuple(sorted(indices))
+        self._matches[description] = found
+        return found
+
+    def categorise(
+        self,
+        description: str,
+        transaction_type: TransactionType,
+        amount: Optional[float],
+    ) -> Optional[Category]:
+        """
+        Return the category of the first rule matching a transaction, or None.
+        """
+        for i in self.matches(description):
+            rule = self.rules[i]
+            if rule.accepts(transaction_type, amount):
+                return rule.category
+        return None
+
+    @staticmethod
+    def load(filename: Path) -> "RuleSet":
+        """
+        Load rules from a JSON file containing a list of objects with a
+        'match' substring and a 'category' name, and optional 'type', 'min'
+        and 'max' fields.
+        """
+        with open(filename, encoding="utf-8") as f:
+            entries = json.load(f)
+            logging.info(f"Read {filename}")
+        rules = []
+        for entry in entries:
+            rules.append(
+                Rule(
+                    entry["match"],
+                    Category[entry["category"].upper()],
+                    TransactionType[entry["type"].upper()] if "type" in entry else None,
+                    float(entry["min"]) if "min" in entry else None,
+                    float(entry["max"]) if "max" in entry else None,
+                )
+            )
+        logging.info(f"Loaded {len(rules)} categorisation rules")
+        return RuleSet(rules)
+
+
+def recategorise_transactions(
+    transactions: Iterable[Transaction], rules: RuleSet
+) -> Dict[Category, int]:
+    """
+    Apply the rules to transactions whose category was assigned by the rules
+    or by default, leaving categories given in the source alone. Return the
+    number of transactions moved into each new category.
+    """
+    counts = {}
+    for t in transactions:
+        if not t.auto_category:
+            continue
+        new_category = rules.categorise(t.description, t.transaction_type, t.amount)
+        if new_category is not None and new_category != t.category:
+            t.category = new_category
+            counts[new_category] = counts.get(new_category, 0) + 1
+    return counts
+
+
+def recategorise_years(years: List[Year], rules: RuleSet) -> Dict[Category, int]:
+    """
+    Apply the rules to the automatically categorised transactions of the given
+    years. Return the number of transactions moved into each new category.
+    """
+    return recategorise_transactions(
+        (t for year in years for month in year.months for t in month.transactions),
+        rules,
+    )
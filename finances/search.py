@@ -0,0 +1,85 @@
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+import gzip
+import json
+import logging
+import re
+
+# Directory of the index within the output directory.
+SEARCH_DIR = "search"
+
+# Number of leading characters of a token used to select its shard.
+SHARD_PREFIX_LENGTH = 2
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenise(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+def build_index(years: list) -> Dict[str, Dict[str, List[int]]]:
+    """
+    Build an inverted index of description and note tokens, split into
+    shards by token prefix. Each token maps to a flat list of postings, three
+    integers (year, month, row) per transaction containing it.
+    """
+    shards = defaultdict(dict)
+    for year in years:
+        for month in year.months:
+            for row, t in enumerate(month.transactions):
+                tokens = set(tokenise(t.description))
+                tokens.update(tokenise(t.note))
+                for token in tokens:
+                    shard = shards[token[:SHARD_PREFIX_LENGTH]]
+                    postings = shard.get(token)
+                    if postings is None:
+                        postings = shard[token] = []
+                    postings.extend((year.index, month.index, row))
+    return dict(shards)
+
+
+def build_rows(year) -> Dict[int, list]:
+    """
+    Return the displayed fields of each transaction in a year, by month.
+    """
+    return {
+        month.index: [
+            [
+                f"{t.date:%d-%m-%Y}",
+                t.transaction_type.name,
+                t.category.name,
+                t.description,
+                t.amount,
+                t.note,
+            ]
+            for t in month.transactions
+        ]
+        for month in year.months
+    }
+
+
+def write_json_gz(filename: Path, data):
+    content = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    # A fixed mtime keeps the output identical when the data is unchanged.
+    with open(filename, "wb") as f:
+        f.write(gzip.compress(content, mtime=0))
+
+
+def write_search_index(years: list, output_dir: Path) -> List[str]:
+    """
+    Write the index shards and the row data of each month as gzipped JSON, and
+    return the list of shard names. Row data is split by month so a query only
+    fetches the months of the results it shows.
+    """
+    search_dir = output_dir / SEARCH_DIR
+    search_dir.mkdir(exist_ok=True)
+    shards = build_index(years)
+    for name, shard in shards.items():
+        write_json_gz(search_dir / f"index-{name}.json.gz", shard)
+    for year in years:
+        for month, rows in build_rows(year).items():
+            write_json_gz(search_dir / f"rows-{year.index}-{month}.json.gz", rows)
+    logging.info(f"Wrote {len(shards)} search index shards to {search_dir}")
+    return sorted(shards)
@@ -5,18 +5,65 @@ import gspread
 import argparse
 from finances.finances import (
     MONTHS_IN_YEAR,
+    SUMMARY,
     Category,
+    Datasets,
     Finances,
     Month,
     Transaction,
     TransactionType,
     Year,
 )
+from finances.diagnostics import (
+    MONTH_OUT_OF_RANGE,
+    SKIPPED_ROW,
+    UNKNOWN_CATEGORY,
+    UNKNOWN_TRANSACTION_TYPE,
+    YEAR_OUT_OF_RANGE,
+    Diagnostics,
+)
+from finances.journal import (
+    ADDED,
+    MODIFIED,
+    REMOVED,
+    Change,
+    append_journal,
+    changed_months,
+    diff_years,
+    imported_changes,
+    read_journal,
+    summarise,
+    transaction_from_dict,
+    transaction_to_dict,
+)
+from finances.report import (
+    COLUMNS,
+    DEFAULT_COLUMNS,
+    FORMATS,
+    GROUP_COLUMNS,
+    PAGE_SIZE,
+    TABLE,
+    iter_rows,
+    select_columns,
+    summarise as summarise_rows,
+    write_report,
+)
+from finances.replay import QUOTA_EXCEEDED, RecordingClient, ReplayClient
+from finances.rules import RuleSet, recategorise_transactions, recategorise_years
 from rich import print
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Collection, Dict, Iterable, List, Optional, Set, Tuple
+import csv
+import functools
+import hashlib
+import itertools
+import json
 import logging
 import pickle
+import re
+import time
 from pathlib import Path
 import datetime
 from dateutil import parser as dateparser
@@ -129,37 +176,61 @@ def transaction_type_from_str(label: str) -> TransactionType:
         raise UnknownTransactionType(f"unknown transaction type: {label}")
 
 
-def check_year(date: datetime.datetime, year_index: int, row):
-    if not (
+def check_year(date: datetime.date, year_index: int) -> bool:
+    return (
         date.year == year_index
         or date.year == year_index - 1
         or date.year == year_index + 1
-    ):
-        logging.error(f"Date year ({date}) is out of range for {year_index}")
-        logging.info(f"Row: {', '.join(row)}")
+    )
 
 
-def check_month(date: datetime.datetime, month_index: int, row):
-    if not (
+def check_month(date: datetime.date, month_index: int) -> bool:
+    return (
         date.month == month_index + 1
         or date.month == 1 + (month_index - 1) % 12
         or date.month == 1 + (month_index + 1) % 12
-    ):
-        logging.error(f"Date month ({date}) is out of range for {month_index}")
-        logging.info(f"Row: {', '.join(row)}")
+    )
+
+
+def validate_month(
+    sheet: str,
+    month: Month,
+    year_index: int,
+    month_index: int,
+    rows: List[int],
+    diagnostics: Diagnostics,
+):
+    """
+    Run the date validation rules over a parsed month. The rows list gives the
+    table row index of each transaction.
+    """
+    for row, t in zip(rows, month.transactions):
+        if not check_year(t.date, year_index):
+            diagnostics.add(sheet, month.index, row, YEAR_OUT_OF_RANGE, t.date)
+        if not check_month(t.date, month_index):
+            diagnostics.add(sheet, month.index, row, MONTH_OUT_OF_RANGE, t.date)
 
 
-def read_old_worksheet_b(table, year_index: int, month_index: int) -> Month:
+def read_old_worksheet_b(
+    table,
+    year_index: int,
+    month_index: int,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheet_name: Optional[str] = None,
+) -> Month:
     """
     Read an old-format worksheet (2016, 2017) and return a Month.
     """
     month = Month(month_index + 1)
+    diagnostics = Diagnostics() if diagnostics is None else diagnostics
+    sheet = SHEETS[year_index].name if sheet_name is None else sheet_name
     category = None
     for i, row in enumerate(table[1:]):
         try:
             # Try and read a category label.
             category = category_from_str(row[0].lower())
-            logging.debug(f"Category set to {category.name}")
+            logging.debug("Category set to %s", category.name)
             continue
         except UnknownCategory:
             pass
@@ -192,24 +263,34 @@ def read_old_worksheet_b(table, year_index: int, month_index: int) -> Month:
             # Append it to the month.
             month.transactions.append(t)
         except InvalidRow as e:
-            logging.warning(f"Skipping row {i+1}: {', '.join(row)}")
+            diagnostics.add(sheet, month.index, i + 1, SKIPPED_ROW, row)
         except UnknownTransactionType as e:
-            logging.error(f"Unknown transaction type on row {i}: {row[2]}")
+            diagnostics.add(sheet, month.index, i + 1, UNKNOWN_TRANSACTION_TYPE, row[0])
     logging.info(f"Read {month.num_transactions()} transactions")
     return month
 
 
-def read_old_worksheet_a(table, year_index: int, month_index: int) -> Month:
+def read_old_worksheet_a(
+    table,
+    year_index: int,
+    month_index: int,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheet_name: Optional[str] = None,
+) -> Month:
     """
     Read an old-format worksheet (2018-2023) and return a Month.
     """
     month = Month(month_index + 1)
+    diagnostics = Diagnostics() if diagnostics is None else diagnostics
+    sheet = SHEETS[year_index].name if sheet_name is None else sheet_name
+    rows = []
     category = None
     for i, row in enumerate(table[1:]):
         try:
             # Try and read a category label.
             category = category_from_str(row[0].lower())
-            logging.debug(f"Category set to {category.name}")
+            logging.debug("Category set to %s", category.name)
             continue
         except UnknownCategory:
             pass
@@ -221,8 +302,6 @@ def read_old_worksheet_a(table, year_index: int, month_index: int) -> Month:
             # Parse the transaction.
             # Date
             date = dateparser.parse(row[0])
-            check_year(date, year_index, row)
-            check_month(date, month_index, row)
             # Type
             transaction_type = transaction_type_from_str(row[1].upper())
             # Description
@@ -239,19 +318,32 @@ def read_old_worksheet_a(table, year_index: int, month_index: int) -> Month:
             t = Transaction(date, transaction_type, category, description, amount, note)
             # Append it to the month.
             month.transactions.append(t)
+            rows.append(i + 1)
         except (InvalidRow, dateparser._parser.ParserError) as e:
-            logging.warning(f"Skipping row {i+1}: {', '.join(row)}")
+            diagnostics.add(sheet, month.index, i + 1, SKIPPED_ROW, row)
         except UnknownTransactionType as e:
-            logging.error(f"Unknown transaction type on row {i}: {row[2]}")
+            diagnostics.add(sheet, month.index, i + 1, UNKNOWN_TRANSACTION_TYPE, row[1])
+    validate_month(sheet, month, year_index, month_index, rows, diagnostics)
     logging.info(f"Read {month.num_transactions()} transactions")
     return month
 
 
-def read_worksheet(table, year_index: int, month_index: int) -> Month:
+def read_worksheet(
+    table,
+    year_index: int,
+    month_index: int,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheet_name: Optional[str] = None,
+) -> Month:
     """
-    Read a new-format worksheet and return a Month.
+    Read a new-format worksheet and return a Month. Rows with a missing or
+    unknown category are categorised by the rules, if given.
     """
     month = Month(month_index + 1)
+    diagnostics = Diagnostics() if diagnostics is None else diagnostics
+    sheet = SHEETS[year_index].name if sheet_name is None else sheet_name
+    rows = []
     assert table[0][0:6] == [
         "Date",
         "Type",
@@ -265,65 +357,257 @@ def read_worksheet(table, year_index: int, month_index: int) -> Month:
             # Parse the transaction.
             # Date
             date = dateparser.parse(row[0])
-            check_year(date, year_index, row)
-            check_month(date, month_index, row)
             # Type
             transaction_type = transaction_type_from_str(row[1].upper())
-            # Category
-            category = category_from_str(row[2].lower())
             # Description
             description = row[3]
             # Amount
             amount = float(row[4].replace("£", "").replace(",", ""))
+            # Category, from the rules if it is missing or unknown.
+            auto_category = False
+            try:
+                category = category_from_str(row[2].lower())
+            except UnknownCategory:
+                if rules is None:
+                    raise
+                category = rules.categorise(description, transaction_type, amount)
+                if category is None:
+                    raise
+                auto_category = True
             # Note
             note = row[5]
-            t = Transaction(date, transaction_type, category, description, amount, note)
+            t = Transaction(
+                date,
+                transaction_type,
+                category,
+                description,
+                amount,
+                note,
+                auto_category,
+            )
             # Append it to the month.
             month.transactions.append(t)
+            rows.append(i + 1)
         except dateparser._parser.ParserError as e:
-            logging.warning(f"Skipping row {i+1}: {', '.join(row)}")
+            diagnostics.add(sheet, month.index, i + 1, SKIPPED_ROW, row)
         except UnknownCategory as e:
-            logging.error(f"Unknown category on row {i}: {row[2]}")
+            diagnostics.add(sheet, month.index, i + 1, UNKNOWN_CATEGORY, row[2])
         except UnknownTransactionType as e:
-            logging.error(f"Unknown transaction type on row {i}: {row[2]}")
+            diagnostics.add(sheet, month.index, i + 1, UNKNOWN_TRANSACTION_TYPE, row[1])
+    validate_month(sheet, month, year_index, month_index, rows, diagnostics)
     logging.info(f"Read {month.num_transactions()} transactions")
     return month
 
 
-def fetch_month(sheet, year_index: int, month_index: int) -> Month:
+# Number of times a Sheets request is retried when the request quota is
+# exceeded, and the delay before the first retry in seconds, doubled after
+# each attempt.
+FETCH_RETRIES = 5
+FETCH_BACKOFF = 2.0
+
+
+def with_retries(request, *args):
+    """
+    Make a Sheets request, retrying with exponential backoff while the
+    request quota is exceeded.
+    """
+    for attempt in itertools.count():
+        try:
+            return request(*args)
+        except gspread.exceptions.APIError as e:
+            if e.code != QUOTA_EXCEEDED or attempt == FETCH_RETRIES:
+                raise
+            delay = FETCH_BACKOFF * 2**attempt
+            logging.warning(f"Request quota exceeded, retrying in {delay:.0f}s")
+            time.sleep(delay)
+
+
+def fetch_month(sheet, month_index: int) -> list:
     """
-    Fetch month data from a particular worksheet.
+    Fetch the raw table of values from a particular worksheet.
     """
     logging.info(f"Opening worksheet {month_index}")
-    # Load
-    worksheet = sheet.get_worksheet(month_index)
-    values = worksheet.get_all_values()
-    # Parse
-    return SHEETS[year_index].reader(values, year_index, month_index)
+    worksheet = with_retries(sheet.get_worksheet, month_index)
+    return with_retries(worksheet.get_all_values)
 
 
-def fetch_year(year_index: int, output_dir: Path) -> Year:
+def fetch_tables(
+    year_index: int, sheets: Optional[Dict[int, Sheet]] = None, client=None
+) -> list:
     """
-    Fetch year data from Google Sheets.
+    Fetch the raw worksheet tables for a year from Google Sheets, or through
+    the given client, such as a RecordingClient or a ReplayClient.
     """
-    gc = gspread.service_account()
-    filename = output_dir / f"finances-{year_index}.pickle"
-    sheet = gc.open(SHEETS[year_index].name)
+    name = (SHEETS if sheets is None else sheets)[year_index].name
+    gc = gspread.service_account() if client is None else client
+    sheet = with_retries(gc.open, name)
     logging.info(
-        f"Opening spreadsheet {SHEETS[year_index].name}, "
-        f"last updated {sheet.get_lastUpdateTime()}"
+        f"Opening spreadsheet {name}, "
+        f"last updated {with_retries(sheet.get_lastUpdateTime)}"
     )
-    worksheet_count = len(sheet.worksheets())
-    year = Year(year_index)
-    for i in range(min(MONTHS_IN_YEAR, worksheet_count)):
-        year.months.append(fetch_month(sheet, year_index, i))
-    # Pickle
+    worksheet_count = len(with_retries(sheet.worksheets))
+    return [fetch_month(sheet, i) for i in range(min(MONTHS_IN_YEAR, worksheet_count))]
+
+
+def save_tables(year_index: int, tables: list, output_dir: Path):
+    """
+    Cache the raw worksheet tables for a year so they can be re-parsed later.
+    """
+    filename = output_dir / f"raw-{year_index}.json"
+    with open(filename, "w", encoding="utf-8") as f:
+        json.dump(tables, f)
+        logging.info(f"Wrote {filename}")
+
+
+def load_tables(year_index: int, output_dir: Path) -> list:
+    """
+    Load the cached raw worksheet tables for a year.
+    """
+    filename = output_dir / f"raw-{year_index}.json"
+    if not filename.exists():
+        raise RuntimeError(f"Raw table cache {filename} does not exist")
+    with open(filename, encoding="utf-8") as f:
+        tables = json.load(f)
+        logging.info(f"Read {filename}")
+    return tables
+
+
+# Categorisation rules of a parsing worker process, sent once when it starts
+# so the automaton is built and its matches memoised once per worker.
+worker_rules = None
+
+
+def init_worker(rules: Optional[RuleSet]):
+    global worker_rules
+    worker_rules = rules
+
+
+def parse_month(task, rules: Optional[RuleSet] = None) -> Tuple[Month, Diagnostics]:
+    """
+    Parse one raw worksheet table into a Month. The task is a tuple of
+    (sheet, year index, month index, table) so it can be dispatched to a
+    worker, which uses the rules it was initialised with unless others are
+    given.
+    """
+    sheet, year_index, month_index, table = task
+    rules = worker_rules if rules is None else rules
+    diagnostics = Diagnostics()
+    month = sheet.reader(table, year_index, month_index, diagnostics, rules, sheet.name)
+    return month, diagnostics
+
+
+def parse_years(
+    tables: Dict[int, list],
+    jobs: Optional[int] = None,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheets: Optional[Dict[int, Sheet]] = None,
+) -> List[Year]:
+    """
+    Parse raw worksheet tables, keyed by year index, into Years. Each month is
+    parsed as a separate task on a pool of worker processes, and the results
+    are merged back in year and month order. With jobs=1 parsing is serial.
+    Validation issues are collected into diagnostics, if given. The sheets
+    give the reader for each year (default: SHEETS).
+    """
+    sheets = SHEETS if sheets is None else sheets
+    tasks = [
+        (sheets[year_index], year_index, month_index, table)
+        for year_index in sorted(tables)
+        for month_index, table in enumerate(tables[year_index])
+    ]
+    if jobs == 1 or len(tasks) <= 1:
+        results = [parse_month(task, rules) for task in tasks]
+    else:
+        with ProcessPoolExecutor(
+            max_workers=jobs, initializer=init_worker, initargs=(rules,)
+        ) as pool:
+            results = list(pool.map(parse_month, tasks))
+    years = {year_index: Year(year_index) for year_index in sorted(tables)}
+    for (_, year_index, _, _), (month, month_diagnostics) in zip(tasks, results):
+        years[year_index].months.append(month)
+        if diagnostics is not None:
+            diagnostics.extend(month_diagnostics)
+    return list(years.values())
+
+
+def save_year(year: Year, output_dir: Path) -> List[Change]:
+    """
+    Write a year to a pickle file, appending the row-level changes from the
+    previously stored version to the journal. Return the changes.
+    """
+    if (output_dir / f"finances-{year.index}.pickle").exists():
+        changes = diff_years(load_year(year.index, output_dir), year)
+    else:
+        changes = diff_years(Year(year.index), year)
+    if changes:
+        counts = summarise(changes)
+        logging.info(
+            f"{year.index}: {counts[ADDED]} added, {counts[REMOVED]} removed, "
+            f"{counts[MODIFIED]} modified"
+        )
+    write_year(year, output_dir)
+    append_journal(output_dir, changes)
+    return changes
+
+
+def write_year(year: Year, output_dir: Path):
+    filename = output_dir / f"finances-{year.index}.pickle"
     with open(filename, "wb") as f:
         pickle.dump(year, f, pickle.HIGHEST_PROTOCOL)
         logging.info(f"Wrote {filename}")
+
+
+def fetch_year(
+    year_index: int,
+    output_dir: Path,
+    jobs: Optional[int] = None,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheets: Optional[Dict[int, Sheet]] = None,
+    client=None,
+) -> Year:
+    """
+    Fetch year data from Google Sheets.
+    """
+    tables = fetch_tables(year_index, sheets, client)
+    save_tables(year_index, tables, output_dir)
+    year = parse_years({year_index: tables}, jobs, diagnostics, rules, sheets)[0]
+    merge_imported(year, output_dir, rules)
+    save_year(year, output_dir)
     return year
 
 
+def reparse_years(
+    year_indices: List[int],
+    output_dir: Path,
+    jobs: Optional[int] = None,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    sheets: Optional[Dict[int, Sheet]] = None,
+) -> List[Year]:
+    """
+    Re-parse cached raw tables and imported transactions for the given years
+    without any network access, and rewrite their pickle files.
+    """
+    tables = {}
+    imported_only = []
+    for year_index in year_indices:
+        if (output_dir / f"raw-{year_index}.json").exists():
+            tables[year_index] = load_tables(year_index, output_dir)
+        elif imported_file(year_index, output_dir).exists():
+            imported_only.append(year_index)
+        else:
+            logging.warning(f"No raw table cache for {year_index}, skipping")
+    years = parse_years(tables, jobs, diagnostics, rules, sheets)
+    years.extend(Year(x) for x in imported_only)
+    years.sort(key=lambda x: x.index)
+    for year in years:
+        merge_imported(year, output_dir, rules)
+        save_year(year, output_dir)
+    return years
+
+
 def load_year(year_index: int, output_dir: Path) -> Year:
     """
     Load a year from a pickle file.
@@ -338,6 +622,373 @@ def load_year(year_index: int, output_dir: Path) -> Year:
     return year
 
 
+def imported_file(year_index: int, output_dir: Path) -> Path:
+    return output_dir / f"imported-{year_index}.jsonl"
+
+
+def append_imported(year_index: int, transactions: List[Transaction], output_dir: Path):
+    """
+    Append imported transactions to the year's imported transaction file, which
+    is kept alongside the raw table cache so re-parsing does not lose them.
+    """
+    if not transactions:
+        return
+    filename = imported_file(year_index, output_dir)
+    with open(filename, mode="a", encoding="utf-8") as f:
+        for t in transactions:
+            f.write(json.dumps(transaction_to_dict(t)) + "\n")
+    logging.info(f"Appended {len(transactions)} transactions to {filename}")
+
+
+def add_transaction(year: Year, t: Transaction):
+    months = year.months
+    while len(months) < t.date.month:
+        months.append(Month(len(months) + 1))
+    months[t.date.month - 1].transactions.append(t)
+
+
+def load_imported(year_index: int, output_dir: Path) -> List[Transaction]:
+    filename = imported_file(year_index, output_dir)
+    if not filename.exists():
+        return []
+    with open(filename, encoding="utf-8") as f:
+        transactions = [transaction_from_dict(json.loads(line)) for line in f]
+        logging.info(f"Read {filename}")
+    return transactions
+
+
+def save_imported(year_index: int, transactions: List[Transaction], output_dir: Path):
+    filename = imported_file(year_index, output_dir)
+    with open(filename, mode="w", encoding="utf-8") as f:
+        for t in transactions:
+            f.write(json.dumps(transaction_to_dict(t)) + "\n")
+        logging.info(f"Wrote {filename}")
+
+
+def merge_imported(year: Year, output_dir: Path, rules: Optional[RuleSet] = None):
+    """
+    Add the year's imported transactions to a year parsed from its worksheets,
+    skipping any that the worksheets already contain. Imported transactions
+    without a category in their statement are categorised by the rules, if
+    given, as worksheet rows are when they are parsed.
+    """
+    imported = load_imported(year.index, output_dir)
+    if rules is not None:
+        recategorise_transactions(imported, rules)
+    existing = Counter(transaction_key(x) for m in year.months for x in m.transactions)
+    for t in imported:
+        key = transaction_key(t)
+        if existing[key] > 0:
+            existing[key] -= 1
+            continue
+        add_transaction(year, t)
+
+
+# Column names recognised in the header row of a CSV bank statement.
+CSV_COLUMNS = {
+    "date": ("Date", "Transaction Date"),
+    "type": ("Type", "Transaction Type"),
+    "description": ("Description", "Transaction Description"),
+    "amount": ("Amount",),
+    "debit": ("Debit", "Debit Amount", "Paid out"),
+    "credit": ("Credit", "Credit Amount", "Paid in"),
+    "category": ("Category",),
+    "note": ("Note", "Notes"),
+}
+
+# Mapping of OFX TRNTYPE values to labels understood by transaction_type_from_str.
+OFX_TRANSACTION_TYPES = {
+    "ATM": "ATM",
+    "CASH": "CASH",
+    "CHECK": "CHQ",
+    "CREDIT": "UNKNOWN",
+    "DEBIT": "UNKNOWN",
+    "DEP": "DEP",
+    "DIRECTDEBIT": "DD",
+    "DIRECTDEP": "BGC",
+    "FEE": "CHG",
+    "INT": "INT",
+    "OTHER": "UNKNOWN",
+    "PAYMENT": "FP",
+    "POS": "POS",
+    "REPEATPMT": "SO",
+    "SRVCHG": "CHG",
+    "XFER": "TFR",
+}
+
+OFX_TAG = re.compile(r"<(/?)(\w+)>([^<]*)")
+
+# Size of blocks read from OFX files.
+OFX_BLOCK_SIZE = 1 << 16
+
+
+def parse_amount(value: str) -> float:
+    return float(value.replace("£", "").replace(",", ""))
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(value: str) -> datetime.date:
+    """
+    Parse a statement date, trying common exact formats before falling back
+    to dateutil. Statements repeat dates heavily, so results are cached.
+    """
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d %b %Y"):
+        try:
+            return datetime.datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    return dateparser.parse(value, dayfirst=True).date()
+
+
+def statement_category(
+    description: str,
+    transaction_type: TransactionType,
+    amount: float,
+    rules: Optional[RuleSet],
+) -> Category:
+    """
+    Return the category for a statement row with no known category: the
+    first matching rule, otherwise MISC.
+    """
+    category = None
+    if rules is not None:
+        category = rules.categorise(description, transaction_type, amount)
+    return Category.MISC if category is None else category
+
+
+def read_csv_statement(
+    f, source: str, diagnostics: Diagnostics, rules: Optional[RuleSet] = None
+):
+    """
+    Yield Transactions from a CSV bank statement, one row at a time.
+    """
+    reader = csv.reader(f)
+    header = [x.strip() for x in next(reader, [])]
+    columns = {}
+    for field, names in CSV_COLUMNS.items():
+        for name in names:
+            if name in header:
+                columns[field] = header.index(name)
+                break
+    if (
+        "date" not in columns
+        or "description" not in columns
+        or not ({"amount", "debit", "credit"} & columns.keys())
+    ):
+        raise RuntimeError(f"Unrecognised CSV statement header in {source}")
+
+    def cell(row, field: str) -> str:
+        index = columns.get(field)
+        return row[index].strip() if index is not None and index < len(row) else ""
+
+    for i, row in enumerate(reader):
+        try:
+            # Date
+            date = parse_date(cell(row, "date"))
+            # Type
+            transaction_type = transaction_type_from_str(cell(row, "type").upper())
+            # Description
+            description = cell(row, "description")
+            # Amount
+            if "amount" in columns:
+                amount = parse_amount(cell(row, "amount"))
+            elif cell(row, "credit"):
+                amount = parse_amount(cell(row, "credit"))
+            elif cell(row, "debit"):
+                amount = -parse_amount(cell(row, "debit"))
+            else:
+                raise InvalidRow()
+            # Category
+            label = cell(row, "category").lower()
+            auto_category = False
+            try:
+                category = category_from_str(label)
+            except UnknownCategory:
+                category = statement_category(
+                    description, transaction_type, amount, rules
+                )
+                if label and category == Category.MISC:
+                    raise
+                auto_category = True
+            yield Transaction(
+                date,
+                transaction_type,
+                category,
+                description,
+                amount,
+                cell(row, "note"),
+                auto_category,
+            )
+        except (InvalidRow, ValueError) as e:
+            diagnostics.add(source, 0, i + 1, SKIPPED_ROW, row)
+        except UnknownCategory as e:
+            diagnostics.add(source, 0, i + 1, UNKNOWN_CATEGORY, cell(row, "category"))
+        except UnknownTransactionType as e:
+            diagnostics.add(
+                source, 0, i + 1, UNKNOWN_TRANSACTION_TYPE, cell(row, "type")
+            )
+
+
+def read_ofx_records(f):
+    """
+    Yield each <STMTTRN> record of an OFX file as a dict of tag values. The
+    file is read in fixed-size blocks, and both SGML (unclosed tags) and XML
+    variants are accepted.
+    """
+    record = None
+    buffer = ""
+    while True:
+        block = f.read(OFX_BLOCK_SIZE)
+        buffer += block
+        # Only tokenise up to the last tag opening, whose value may continue
+        # into the next block.
+        end = len(buffer) if not block else buffer.rfind("<")
+        for match in OFX_TAG.finditer(buffer, 0, max(end, 0)):
+            closing, tag, value = match.groups()
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if record is not None:
+                    yield record
+                record = None if closing else {}
+            elif record is not None and not closing:
+                record[tag] = value.strip()
+        if not block:
+            break
+        buffer = buffer[max(end, 0) :]
+    if record is not None:
+        yield record
+
+
+def read_ofx_statement(
+    f, source: str, diagnostics: Diagnostics, rules: Optional[RuleSet] = None
+):
+    """
+    Yield Transactions from an OFX bank statement, one record at a time.
+    """
+    for i, record in enumerate(read_ofx_records(f)):
+        try:
+            date = datetime.datetime.strptime(record["DTPOSTED"][:8], "%Y%m%d").date()
+            label = record.get("TRNTYPE", "").upper()
+            transaction_type = transaction_type_from_str(
+                OFX_TRANSACTION_TYPES.get(label, label)
+            )
+            description = record.get("NAME", "")
+            amount = parse_amount(record["TRNAMT"])
+            yield Transaction(
+                date,
+                transaction_type,
+                statement_category(description, transaction_type, amount, rules),
+                description,
+                amount,
+                record.get("MEMO", ""),
+                auto_category=True,
+            )
+        except (KeyError, ValueError) as e:
+            diagnostics.add(source, 0, i + 1, SKIPPED_ROW, list(record.values()))
+        except UnknownTransactionType as e:
+            diagnostics.add(source, 0, i + 1, UNKNOWN_TRANSACTION_TYPE, label)
+
+
+def read_statement(
+    f, source: str, diagnostics: Diagnostics, rules: Optional[RuleSet] = None
+):
+    """
+    Yield Transactions from a bank statement, choosing the format by suffix.
+    """
+    suffix = Path(source).suffix.lower()
+    if suffix == ".csv":
+        return read_csv_statement(f, source, diagnostics, rules)
+    elif suffix in (".ofx", ".qfx"):
+        return read_ofx_statement(f, source, diagnostics, rules)
+    else:
+        raise RuntimeError(f"Unsupported statement format: {source}")
+
+
+def transaction_key(t: Transaction) -> tuple:
+    return (t.date, t.transaction_type, t.amount, t.description)
+
+
+def import_statement(
+    filename: Path,
+    output_dir: Path,
+    diagnostics: Optional[Diagnostics] = None,
+    rules: Optional[RuleSet] = None,
+    year_indices: Optional[Collection[int]] = None,
+) -> List[int]:
+    """
+    Stream a CSV or OFX bank statement into the per-year store, appending each
+    transaction to the Month of its date and to the year's imported transaction
+    file. Transactions already in the store (for example from an overlapping
+    earlier import) are skipped, as are transactions outside the given years,
+    which are recorded as diagnostics. Rows with no known category are
+    categorised by the rules, if given, otherwise MISC. A year is saved as soon
+    as the statement moves on to another year, so only one year is held in
+    memory for a date-ordered statement. Return the indices of the years
+    touched.
+    """
+    diagnostics = Diagnostics() if diagnostics is None else diagnostics
+    # The year being imported into, the keys of its existing transactions and
+    # the transactions added to it.
+    year = None
+    existing = None
+    added = []
+    touched = []
+    imported = 0
+    skipped = 0
+    out_of_range = 0
+
+    def flush():
+        # Only transactions were appended, so the changes are known without
+        # diffing against the stored year.
+        if not added:
+            return
+        append_imported(year.index, added, output_dir)
+        write_year(year, output_dir)
+        append_journal(output_dir, imported_changes(year, added))
+        logging.info(f"{year.index}: {len(added)} imported")
+        added.clear()
+
+    with open(filename, encoding="utf-8-sig", newline="") as f:
+        for t in read_statement(f, filename.name, diagnostics, rules):
+            if year_indices is not None and t.date.year not in year_indices:
+                diagnostics.add(
+                    filename.name,
+                    0,
+                    0,
+                    YEAR_OUT_OF_RANGE,
+                    [t.date, t.description, t.amount],
+                )
+                out_of_range += 1
+                continue
+            if year is None or t.date.year != year.index:
+                if year is not None:
+                    flush()
+                year = load_year(t.date.year, output_dir)
+                existing = Counter(
+                    transaction_key(x) for m in year.months for x in m.transactions
+                )
+                if year.index not in touched:
+                    touched.append(year.index)
+            key = transaction_key(t)
+            if existing[key] > 0:
+                existing[key] -= 1
+                skipped += 1
+                continue
+            add_transaction(year, t)
+            added.append(t)
+            imported += 1
+    if year is not None:
+        flush()
+    logging.info(f"Imported {imported} transactions from {filename}")
+    if skipped:
+        logging.info(f"Skipped {skipped} transactions already in the store")
+    if out_of_range:
+        logging.warning(
+            f"Skipped {out_of_range} transactions outside the dataset's years"
+        )
+    return sorted(touched)
+
+
 SHEETS = {
     2016: Sheet("Spending-2016", read_old_worksheet_b),
     2017: Sheet("Spending-2017", read_old_worksheet_b),
@@ -353,30 +1004,354 @@ SHEETS = {
 }
 
 
+# Reader for each worksheet format named in a datasets file.
+READERS = {
+    "old-b": read_old_worksheet_b,
+    "old-a": read_old_worksheet_a,
+    "new": read_worksheet,
+}
+
+
+@dataclass
+class Dataset:
+    """
+    A named set of spreadsheets, one per year, stored and rendered in a
+    subdirectory of the output directory with the same name.
+    """
+
+    name: str
+    title: str
+    sheets: Dict[int, Sheet]
+
+
+DEFAULT_DATASETS = "datasets.json"
+
+
+def load_datasets(filename: Optional[str]) -> List[Dataset]:
+    """
+    Load datasets from a file, or from the default datasets file if it exists.
+    Otherwise, return a single unnamed dataset of SHEETS, stored and rendered
+    in the output directory itself.
+    """
+    if filename is None:
+        if not Path(DEFAULT_DATASETS).exists():
+            return [Dataset("", "Finances", SHEETS)]
+        filename = DEFAULT_DATASETS
+    with open(filename, encoding="utf-8") as f:
+        entries = json.load(f)
+        logging.info(f"Read {filename}")
+    datasets = []
+    for entry in entries:
+        name = entry["name"]
+        if not re.fullmatch(r"[\w-]+", name):
+            raise RuntimeError(f"Invalid dataset name: '{name}'")
+        if name in (x.name for x in datasets):
+            raise RuntimeError(f"Duplicate dataset name: '{name}'")
+        sheets = {}
+        for year, sheet in entry["sheets"].items():
+            if sheet["format"] not in READERS:
+                raise RuntimeError(f"Unknown worksheet format: '{sheet['format']}'")
+            sheets[int(year)] = Sheet(sheet["name"], READERS[sheet["format"]])
+        datasets.append(Dataset(name, entry.get("title", name), sheets))
+    return datasets
+
+
+def select_dataset(datasets: List[Dataset], name: Optional[str]) -> Dataset:
+    if name is None:
+        return datasets[0]
+    for dataset in datasets:
+        if dataset.name == name:
+            return dataset
+    raise RuntimeError(f"Unknown dataset: '{name}'")
+
+
+# Stamp file recording the time a dataset was last rendered, and a hash of
+# the render context shared by all of its pages.
+RENDER_STAMP = ".rendered"
+
+
+def render_context(datasets: List[Dataset]) -> str:
+    """
+    Return a hash of what every page depends on besides its own data: the
+    title and years of each dataset (shown in the navigation bar) and the
+    definitions of the other datasets.
+    """
+    context = [
+        dict(
+            name=dataset.name,
+            title=dataset.title,
+            sheets={
+                year: [sheet.name, sheet.reader.__name__]
+                for year, sheet in sorted(dataset.sheets.items())
+            },
+        )
+        for dataset in datasets
+    ]
+    return hashlib.sha256(json.dumps(context).encode("utf-8")).hexdigest()
+
+
+def write_render_stamp(output_dir: Path, time: str, context: str):
+    stamp = output_dir / RENDER_STAMP
+    stamp.write_text(json.dumps(dict(time=time, context=context)))
+
+
+def changes_since_render(
+    output_dir: Path, context: str
+) -> Optional[Set[Tuple[int, int]]]:
+    """
+    Return the (year, month) pairs changed in a dataset's journal since it was
+    last rendered, or None if it needs to be rendered in full because it has
+    not been rendered before, or the templates or the render context have
+    changed since.
+    """
+    stamp = output_dir / RENDER_STAMP
+    if not stamp.exists() or not (output_dir / SUMMARY).exists():
+        return None
+    try:
+        rendered = json.loads(stamp.read_text())
+    except ValueError:
+        return None
+    if rendered.get("context") != context:
+        logging.info(f"Render context of {output_dir} changed, rendering in full")
+        return None
+    modified = stamp.stat().st_mtime
+    if any(x.stat().st_mtime > modified for x in Path("templates").iterdir()):
+        return None
+    return changed_months(read_journal(output_dir, rendered["time"]))
+
+
+DEFAULT_RULES = "rules.json"
+
+
+def load_rules(filename: Optional[str]) -> Optional[RuleSet]:
+    """
+    Load categorisation rules from a file, or from the default rules file if
+    it exists.
+    """
+    if filename is None:
+        if not Path(DEFAULT_RULES).exists():
+            return None
+        filename = DEFAULT_RULES
+    return RuleSet.load(Path(filename))
+
+
+def recategorise(year_indices: List[int], output_dir: Path, rules: RuleSet):
+    """
+    Apply the categorisation rules to transactions in the store whose category
+    was assigned by the rules or by default, and rewrite the pickle files of
+    years that changed, and their imported transactions, so the new categories
+    are kept when a year is rebuilt.
+    """
+    for year_index in year_indices:
+        if not (output_dir / f"finances-{year_index}.pickle").exists():
+            continue
+        year = load_year(year_index, output_dir)
+        counts = recategorise_years([year], rules)
+        for category, count in counts.items():
+            logging.info(f"{year_index}: {count} transactions to {category.name}")
+        if counts:
+            save_year(year, output_dir)
+        imported = load_imported(year_index, output_dir)
+        if recategorise_transactions(imported, rules):
+            save_imported(year_index, imported, output_dir)
+
+
+def report_diagnostics(
+    diagnostics: Diagnostics,
+    years: List[Year],
+    output_dir: Path,
+    write: bool,
+    root: str = "",
+):
+    """
+    Log a summary of validation issues and optionally write the drill-down.
+    """
+    diagnostics.report()
+    if write:
+        diagnostics.write_json(output_dir / "diagnostics.json")
+        diagnostics.write_html(output_dir / "diagnostics.html", years, root)
+
+
+def column_list(choices: List[str]):
+    """
+    Return an argument type for a comma-separated list of column names.
+    """
+
+    def parse(value: str) -> List[str]:
+        columns = value.split(",")
+        for column in columns:
+            if column not in choices:
+                raise argparse.ArgumentTypeError(f"Unknown column: '{column}'")
+        return columns
+
+    return parse
+
+
+def category_arg(value: str) -> Category:
+    """
+    Parse a category given on the command line by name or spreadsheet label.
+    """
+    try:
+        return Category[value.upper().replace(" ", "_")]
+    except KeyError:
+        pass
+    try:
+        return category_from_str(value.lower())
+    except UnknownCategory:
+        raise argparse.ArgumentTypeError(f"Unknown category: '{value}'")
+
+
+def positive_int(value: str) -> int:
+    """
+    Parse a strictly positive integer given on the command line.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid number: '{value}'")
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"Must be a positive number: '{value}'")
+    return number
+
+
+def report(years: Iterable[Year], args):
+    """
+    Stream the transactions of the given years to standard output, filtered
+    and formatted according to the command-line arguments, or a summary of
+    them if grouping is requested.
+    """
+    rows = iter_rows(years, args.month, args.category)
+    fmt = args.report or TABLE
+    if args.group_by:
+        headers, summary = summarise_rows(rows, args.group_by)
+        count = write_report(summary, headers, fmt, page_size=args.page_size)
+    else:
+        count = write_report(
+            select_columns(rows, args.columns),
+            args.columns,
+            fmt,
+            page_size=args.page_size,
+        )
+    logging.info(f"Reported {count} rows")
+
+
+def sheets_client(args):
+    """
+    Return the client used to fetch spreadsheets: a replay of recorded
+    responses, or a Google Sheets client, optionally recording its responses.
+    """
+    if args.replay:
+        return ReplayClient(Path(args.replay), args.latency, args.quota_error_rate)
+    client = gspread.service_account()
+    if args.record:
+        return RecordingClient(client, Path(args.record))
+    return client
+
+
 def main(args):
 
     # Output path.
     output_path = Path(args.output_dir)
     output_path.mkdir(exist_ok=True)
 
+    # Datasets, and the one to update.
+    datasets = load_datasets(args.datasets)
+    dataset = select_dataset(datasets, args.dataset)
+    dataset_path = output_path / dataset.name
+    dataset_path.mkdir(exist_ok=True)
+    root = "../" if dataset.name else ""
+    year_indices = [args.year] if args.year else list(dataset.sheets.keys())
+
+    # Categorisation rules.
+    rules = load_rules(args.rules)
+
     if args.fetch:
         if not args.year:
             raise RuntimeError("Specify a year to fetch (--year)")
 
         # Just fetch a particular year.
-        fetch_year(args.year, output_path)
+        diagnostics = Diagnostics()
+        years = [
+            fetch_year(
+                args.year,
+                dataset_path,
+                args.jobs,
+                diagnostics,
+                rules,
+                dataset.sheets,
+                sheets_client(args),
+            )
+        ]
+        report_diagnostics(diagnostics, years, dataset_path, args.diagnostics, root)
         return
 
-    # Load pickled data.
-    dataset = Finances([load_year(x, output_path) for x in SHEETS.keys()])
+    if args.import_files:
+        # Import bank statements into the per-year store.
+        diagnostics = Diagnostics()
+        touched = set()
+        for filename in args.import_files:
+            touched.update(
+                import_statement(
+                    Path(filename),
+                    dataset_path,
+                    diagnostics,
+                    rules,
+                    dataset.sheets.keys(),
+                )
+            )
+        years = [Year(x) for x in sorted(touched)]
+        report_diagnostics(diagnostics, years, dataset_path, args.diagnostics, root)
+        return
+
+    if args.reparse:
+        # Re-parse cached raw tables for one or all years.
+        diagnostics = Diagnostics()
+        years = reparse_years(
+            year_indices, dataset_path, args.jobs, diagnostics, rules, dataset.sheets
+        )
+        report_diagnostics(diagnostics, years, dataset_path, args.diagnostics, root)
+        return
+
+    if args.recategorise:
+        if rules is None:
+            raise RuntimeError("Categorisation rules are required (--rules)")
+        # Re-categorise stored transactions for one or all years.
+        recategorise(year_indices, dataset_path, rules)
+        return
+
+    if args.report:
+        # Stream transactions from the store a year at a time, without
+        # rendering.
+        report((load_year(x, dataset_path) for x in year_indices), args)
+        return
+
+    # Find what changed in each dataset since it was last rendered, and load
+    # the pickled data of datasets with changes.
+    rendered = datetime.datetime.now().isoformat(timespec="seconds")
+    context = render_context(datasets)
+    finances = []
+    changed = {}
+    for dataset in datasets:
+        path = output_path / dataset.name
+        path.mkdir(exist_ok=True)
+        changed[dataset.name] = (
+            None if args.full else changes_since_render(path, context)
+        )
+        if changed[dataset.name] == set():
+            years = []
+        else:
+            years = [load_year(x, path) for x in dataset.sheets.keys()]
+        finances.append(Finances(years, dataset.name, dataset.title))
 
     # Render the HTML.
-    dataset.create_html_report(output_path)
+    Datasets(finances).create_html_report(output_path, changed)
+    for dataset in datasets:
+        write_render_stamp(output_path / dataset.name, rendered, context)
 
     if args.report_transactions:
-        for year in dataset.years:
-            for month in year.months:
-                month.report_transactions()
+        for dataset in datasets:
+            path = output_path / dataset.name
+            report((load_year(x, path) for x in dataset.sheets.keys()), args)
 
 
 if __name__ == "__main__":
@@ -385,6 +1360,83 @@ if __name__ == "__main__":
     parser.add_argument(
         "--fetch", action="store_true", help="Fetch data from Google Sheets"
     )
+    parser.add_argument(
+        "--record",
+        default=None,
+        metavar="DIR",
+        help="With --fetch, record Google Sheets responses in a directory",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="DIR",
+        help="With --fetch, replay recorded responses instead of Google Sheets",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="With --replay, delay each request (default: 0)",
+    )
+    parser.add_argument(
+        "--quota-error-rate",
+        type=float,
+        default=0.0,
+        metavar="P",
+        help="With --replay, fail requests with probability P (default: 0)",
+    )
+    parser.add_argument(
+        "--reparse",
+        action="store_true",
+        help="Re-parse cached raw tables without fetching (all years unless --year)",
+    )
+    parser.add_argument(
+        "--import",
+        dest="import_files",
+        nargs="+",
+        metavar="FILE",
+        help="Import CSV or OFX bank statements into the per-year store",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=positive_int,
+        default=None,
+        help="Number of worker processes for parsing (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--rules",
+        default=None,
+        metavar="FILE",
+        help=f"Categorisation rules file (default: '{DEFAULT_RULES}' if present)",
+    )
+    parser.add_argument(
+        "--recategorise",
+        action="store_true",
+        help="Re-apply categorisation rules to stored rule-categorised transactions",
+    )
+    parser.add_argument(
+        "--diagnostics",
+        action="store_true",
+        help="Write validation issues to diagnostics.json and diagnostics.html",
+    )
+    parser.add_argument(
+        "--datasets",
+        default=None,
+        metavar="FILE",
+        help=f"Datasets file (default: '{DEFAULT_DATASETS}' if present)",
+    )
+    parser.add_argument(
+        "--dataset",
+        default=None,
+        metavar="NAME",
+        help="Dataset to fetch, import or re-parse (default: the first)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Render all pages, not only those changed since the last render",
+    )
     parser.add_argument(
         "--year",
         type=int,
@@ -400,10 +1452,53 @@ if __name__ == "__main__":
     parser.add_argument(
         "--report-transactions",
         action="store_true",
-        help="Display transactions in a table",
+        help="Display transactions in a table after rendering",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        choices=FORMATS,
+        help="Stream stored transactions to the terminal instead of rendering",
+    )
+    parser.add_argument(
+        "--month",
+        type=int,
+        action="append",
+        choices=range(1, MONTHS_IN_YEAR + 1),
+        help="Only report a particular month (may be repeated)",
+    )
+    parser.add_argument(
+        "--category",
+        type=category_arg,
+        action="append",
+        help="Only report a particular category (may be repeated)",
+    )
+    parser.add_argument(
+        "--columns",
+        type=column_list(list(COLUMNS)),
+        default=DEFAULT_COLUMNS,
+        metavar="COLUMN,...",
+        help=f"Columns to report (from: {', '.join(COLUMNS)})",
+    )
+    parser.add_argument(
+        "--group-by",
+        type=column_list(GROUP_COLUMNS),
+        default=None,
+        metavar="COLUMN,...",
+        help=f"Report totals by group (from: {', '.join(GROUP_COLUMNS)})",
+    )
+    parser.add_argument(
+        "--page-size",
+        type=positive_int,
+        default=PAGE_SIZE,
+        help=f"Number of rows written at a time (default: {PAGE_SIZE})",
     )
     parser.add_argument("--debug", action="store_true", help="Print debugging messages")
     args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together")
+    if not args.replay and (args.latency or args.quota_error_rate):
+        parser.error("--latency and --quota-error-rate require --replay")
     # Setup logging.
     if args.debug:
         logging.basicConfig(level=logging.DEBUG)
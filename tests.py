@@ -7,17 +7,73 @@ from finances.finances import (
     Month,
     Year,
     Finances,
+    Datasets,
+    SUMMARY,
+    Trends,
 )
+from finances.diagnostics import (
+    MONTH_OUT_OF_RANGE,
+    SKIPPED_ROW,
+    UNKNOWN_CATEGORY,
+    UNKNOWN_TRANSACTION_TYPE,
+    YEAR_OUT_OF_RANGE,
+    Diagnostics,
+)
+from finances.journal import (
+    ADDED,
+    MODIFIED,
+    REMOVED,
+    changed_months,
+    diff_years,
+    read_journal,
+)
+from finances.search import build_index
+from finances.report import (
+    JSONL,
+    TABLE,
+    TSV,
+    iter_rows,
+    select_columns,
+    summarise as summarise_rows,
+    write_report,
+)
+from finances.replay import QuotaExceeded, RecordingClient, ReplayClient
+from finances.replay import record_spreadsheet
+from finances.rules import Rule, RuleSet, recategorise_years
 from main import (
+    SHEETS,
+    Dataset,
     category_from_str,
+    changes_since_render,
+    fetch_tables,
+    fetch_year,
+    import_statement,
+    load_datasets,
+    load_year,
+    parse_years,
+    positive_int,
+    read_worksheet,
+    recategorise,
+    render_context,
+    reparse_years,
+    save_tables,
     transaction_type_from_str,
+    write_render_stamp,
     UnknownCategory,
     UnknownTransactionType,
 )
+import argparse
 import datetime
+import gzip
+import io
+import itertools
+import json
+import pickle
 import tempfile
 import shutil
 from pathlib import Path
+from unittest import mock
+import gspread
 
 
 def make_transaction(
@@ -33,6 +89,59 @@ def make_transaction(
     )
 
 
+class TestTransaction(unittest.TestCase):
+    def test_datetime_stored_as_date(self):
+        t = make_transaction(Category.MISC, 1.0)
+        t2 = Transaction(
+            datetime.datetime(2024, 1, 1, 12, 30),
+            TransactionType.POS,
+            Category.MISC,
+            "test",
+            1.0,
+            "",
+        )
+        self.assertIs(type(t2.date), datetime.date)
+        self.assertEqual(t2.date, t.date)
+
+    def test_strings_are_interned(self):
+        a = make_transaction(Category.MISC, 1.0)
+        b = Transaction(
+            date=datetime.datetime(2024, 1, 1, 12, 30),
+            transaction_type=TransactionType.FPI,
+            category=Category.MISC,
+            description="".join(["te", "st"]),
+            amount=3.0,
+            note="",
+        )
+        self.assertIs(a.description, b.description)
+        self.assertEqual(b.date, datetime.date(2024, 1, 1))
+
+    def test_no_instance_dict(self):
+        t = make_transaction(Category.MISC, 1.0)
+        self.assertFalse(hasattr(t, "__dict__"))
+
+    def test_pickle_round_trip(self):
+        t = make_transaction(Category.BILLS, -20.0)
+        self.assertEqual(pickle.loads(pickle.dumps(t)), t)
+
+    def test_unpickle_legacy_dict_state(self):
+        # Pickles written by the previous regular dataclass carry a dict of
+        # fields, with a datetime for the date.
+        t = Transaction.__new__(Transaction)
+        t.__setstate__(
+            dict(
+                date=datetime.datetime(2024, 1, 1, 9, 0),
+                transaction_type=TransactionType.FPI,
+                category=Category.INCOME,
+                description="test",
+                amount=10.0,
+                note="",
+            )
+        )
+        self.assertEqual(t, make_transaction(Category.INCOME, 10.0))
+        self.assertFalse(t.auto_category)
+
+
 class TestMonth(unittest.TestCase):
     def test_balance_empty(self):
         self.assertEqual(Month(1).balance(), 0.0)
@@ -94,6 +203,56 @@ class TestYear(unittest.TestCase):
         self.assertAlmostEqual(y.balance(), 2400.0)  # 3 * (1000 - 200)
 
 
+class TestTrends(unittest.TestCase):
+    def setUp(self):
+        # Two years, the second with only three months, and a missing year.
+        self.years = [Year(2022), Year(2023), Year(2024)]
+        for year, count in ((self.years[0], 12), (self.years[2], 3)):
+            for month_num in range(1, count + 1):
+                m = Month(month_num)
+                m.transactions = [
+                    make_transaction(Category.INCOME, 100.0 * month_num),
+                    make_transaction(Category.BILLS, -10.0),
+                    make_transaction(Category.BILLS, -10.0),
+                ]
+                year.months.append(m)
+        self.trends = Trends(self.years)
+
+    def test_matrix(self):
+        self.assertEqual(self.trends.num_months(), 27)
+        self.assertEqual(self.trends.labels[0], "Jan 2022")
+        self.assertEqual(self.trends.labels[-1], "Mar 2024")
+        self.assertEqual(self.trends.series(Category.BILLS)[0], -20.0)
+        self.assertEqual(self.trends.series(Category.BILLS)[12], 0.0)
+        self.assertEqual(self.trends.series(Category.INCOME)[26], 300.0)
+
+    def test_balance(self):
+        balance = self.trends.balance()
+        self.assertAlmostEqual(balance[0], 80.0)
+        self.assertAlmostEqual(balance[-1], sum(y.balance() for y in self.years))
+
+    def test_rolling_average(self):
+        rolling = self.trends.rolling_average(Category.INCOME, 3)
+        self.assertEqual(rolling[:2], [None, None])
+        self.assertAlmostEqual(rolling[2], 200.0)
+        self.assertAlmostEqual(rolling[11], 1100.0)
+        self.assertAlmostEqual(rolling[13], 400.0)
+        rolling = self.trends.rolling_average(Category.BILLS, 12)
+        self.assertAlmostEqual(rolling[11], -20.0)
+        self.assertAlmostEqual(rolling[23], 0.0)
+
+    def test_year_on_year(self):
+        deltas = self.trends.year_on_year(Category.INCOME)
+        self.assertEqual(deltas[:12], [None] * 12)
+        self.assertAlmostEqual(deltas[12], -100.0)
+        self.assertAlmostEqual(deltas[24], 100.0)
+
+    def test_empty(self):
+        trends = Trends([Year(2024)])
+        self.assertEqual(trends.num_months(), 0)
+        self.assertEqual(trends.balance(), [])
+
+
 class TestCategoryFromStr(unittest.TestCase):
     def test_canonical_names(self):
         cases = [
@@ -192,6 +351,521 @@ class TestTransactionTypeFromStr(unittest.TestCase):
             transaction_type_from_str("NOTACODE")
 
 
+NEW_FORMAT_HEADER = ["Date", "Type", "Category", "Description", "Amount", "Note"]
+
+
+def make_table(year: int, month: int, count: int) -> list:
+    """
+    Return a raw new-format worksheet table with the given number of rows.
+    """
+    rows = [
+        [f"{year}-{month:02d}-{day:02d}", "POS", "shopping", f"shop {day}", "-1.50", ""]
+        for day in range(1, count + 1)
+    ]
+    return [NEW_FORMAT_HEADER] + rows
+
+
+class TestParseYears(unittest.TestCase):
+    def setUp(self):
+        self.tables = {
+            year: [make_table(year, month, month) for month in range(1, 13)]
+            for year in (2024, 2025)
+        }
+
+    def check_years(self, years):
+        self.assertEqual([y.index for y in years], [2024, 2025])
+        for year in years:
+            self.assertEqual([m.index for m in year.months], list(range(1, 13)))
+            for month in year.months:
+                self.assertEqual(month.num_transactions(), month.index)
+                self.assertEqual(month.transactions[0].date.month, month.index)
+
+    def test_serial(self):
+        self.check_years(parse_years(self.tables, jobs=1))
+
+    def test_parallel_matches_serial(self):
+        serial = parse_years(self.tables, jobs=1)
+        parallel = parse_years(self.tables, jobs=2)
+        self.check_years(parallel)
+        for a, b in zip(serial, parallel):
+            for ma, mb in zip(a.months, b.months):
+                self.assertEqual(ma.transactions, mb.transactions)
+
+    def test_reparse_from_cache(self):
+        output_path = Path(tempfile.mkdtemp())
+        try:
+            for year_index, tables in self.tables.items():
+                save_tables(year_index, tables, output_path)
+            reparse_years([2024, 2025, 2026], output_path, jobs=2)
+            self.check_years([load_year(y, output_path) for y in (2024, 2025)])
+            self.assertFalse((output_path / "finances-2026.pickle").exists())
+        finally:
+            shutil.rmtree(output_path)
+
+
+class TestFetchReplay(unittest.TestCase):
+    def setUp(self):
+        self.tables = [make_table(2024, month, month) for month in range(1, 13)]
+        self.recording_path = Path(tempfile.mkdtemp())
+        self.output_path = Path(tempfile.mkdtemp())
+        record_spreadsheet(
+            self.recording_path, SHEETS[2024].name, "2024-12-31", self.tables
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.recording_path)
+        shutil.rmtree(self.output_path)
+
+    def test_replay(self):
+        client = ReplayClient(self.recording_path)
+        self.assertEqual(fetch_tables(2024, client=client), self.tables)
+        # Open, last update time, worksheets, and two requests per worksheet.
+        self.assertEqual(client.num_requests, 3 + 2 * len(self.tables))
+
+    def test_record_round_trip(self):
+        rerecorded_path = self.output_path / "recording"
+        client = RecordingClient(ReplayClient(self.recording_path), rerecorded_path)
+        self.assertEqual(fetch_tables(2024, client=client), self.tables)
+        client = ReplayClient(rerecorded_path)
+        self.assertEqual(fetch_tables(2024, client=client), self.tables)
+
+    @mock.patch("main.FETCH_BACKOFF", 0.0)
+    def test_quota_errors_retried(self):
+        client = ReplayClient(self.recording_path, quota_error_rate=0.3, seed=1)
+        year = fetch_year(2024, self.output_path, jobs=1, client=client)
+        self.assertGreater(client.num_quota_errors, 0)
+        self.assertEqual(
+            [m.num_transactions() for m in year.months], list(range(1, 13))
+        )
+        self.assertTrue((self.output_path / "raw-2024.json").exists())
+
+    @mock.patch("main.FETCH_BACKOFF", 0.0)
+    def test_quota_errors_exhausted(self):
+        client = ReplayClient(self.recording_path, quota_error_rate=1.0)
+        with self.assertRaises(gspread.exceptions.APIError):
+            fetch_tables(2024, client=client)
+
+    def test_quota_error(self):
+        error = QuotaExceeded()
+        self.assertEqual(error.code, 429)
+        self.assertIn("Quota exceeded", str(error))
+        self.assertEqual(pickle.loads(pickle.dumps(error)).code, 429)
+
+    def test_missing_spreadsheet(self):
+        with self.assertRaises(gspread.exceptions.SpreadsheetNotFound):
+            fetch_tables(2025, client=ReplayClient(self.recording_path))
+
+
+class TestDiagnostics(unittest.TestCase):
+    def setUp(self):
+        table = make_table(2024, 3, 3)
+        table[1][1] = "NOTACODE"
+        table[2][2] = "not a category"
+        table.append(["not a date", "POS", "shopping", "x", "-1.00", ""])
+        table.append(["2024-07-01", "POS", "shopping", "x", "-1.00", ""])
+        self.diagnostics = Diagnostics()
+        self.month = read_worksheet(table, 2024, 2, self.diagnostics)
+
+    def test_issues_recorded(self):
+        self.assertEqual(self.month.num_transactions(), 2)
+        issues = [(x.row, x.rule, x.value) for x in self.diagnostics.issues]
+        self.assertIn((1, UNKNOWN_TRANSACTION_TYPE, "NOTACODE"), issues)
+        self.assertIn((2, UNKNOWN_CATEGORY, "not a category"), issues)
+        self.assertIn((5, MONTH_OUT_OF_RANGE, datetime.date(2024, 7, 1)), issues)
+        self.assertEqual(self.diagnostics.count_by_rule()[SKIPPED_ROW], 1)
+        self.assertEqual(self.diagnostics.count_by_sheet(), {"Spending-2024": 4})
+
+    def test_parse_years_collects_from_workers(self):
+        tables = {2024: [make_table(2024, 1, 1), make_table(2024, 5, 1)]}
+        diagnostics = Diagnostics()
+        parse_years(tables, jobs=2, diagnostics=diagnostics)
+        self.assertEqual(diagnostics.count_by_rule(), {MONTH_OUT_OF_RANGE: 1})
+        self.assertEqual(diagnostics.issues[0].month, 2)
+
+    def test_write_json_and_html(self):
+        output_path = Path(tempfile.mkdtemp())
+        try:
+            self.diagnostics.write_json(output_path / "diagnostics.json")
+            self.diagnostics.write_html(output_path / "diagnostics.html")
+            with open(output_path / "diagnostics.json") as f:
+                records = json.load(f)
+            self.assertEqual(len(records), 4)
+            self.assertEqual(records[0]["sheet"], "Spending-2024")
+            self.assertTrue((output_path / "diagnostics.html").exists())
+        finally:
+            shutil.rmtree(output_path)
+
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class TestImportStatement(unittest.TestCase):
+    def setUp(self):
+        self.output_path = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.output_path)
+
+    def test_csv_buckets_by_date(self):
+        diagnostics = Diagnostics()
+        years = import_statement(
+            FIXTURES / "statement.csv", self.output_path, diagnostics
+        )
+        self.assertEqual(years, [2023, 2024])
+        y2023 = load_year(2023, self.output_path)
+        self.assertEqual(len(y2023.months), 12)
+        self.assertEqual(y2023.months[11].num_transactions(), 2)
+        self.assertAlmostEqual(y2023.balance(), 1996.8)
+        y2024 = load_year(2024, self.output_path)
+        self.assertEqual([m.num_transactions() for m in y2024.months], [3, 1])
+        self.assertEqual(y2024.months[1].transactions[0].transaction_type.name, "SO")
+        self.assertEqual(
+            diagnostics.count_by_rule(),
+            {SKIPPED_ROW: 1, UNKNOWN_TRANSACTION_TYPE: 1},
+        )
+
+    def test_reimport_skips_existing(self):
+        import_statement(FIXTURES / "statement.csv", self.output_path)
+        import_statement(FIXTURES / "statement.csv", self.output_path)
+        y2024 = load_year(2024, self.output_path)
+        self.assertEqual([m.num_transactions() for m in y2024.months], [3, 1])
+
+    def test_journal_refers_to_imported(self):
+        import_statement(FIXTURES / "statement.csv", self.output_path)
+        entries = list(read_journal(self.output_path))
+        self.assertTrue(all(x["imported"] for x in entries))
+        self.assertNotIn("transaction", entries[0])
+        # Keys match those of a full comparison with the stored years.
+        expected = [
+            change.to_dict()["key"]
+            for year_index in [2023, 2024]
+            for change in diff_years(
+                Year(year_index), load_year(year_index, self.output_path)
+            )
+        ]
+        self.assertEqual([x["key"] for x in entries], expected)
+
+    def test_years_outside_dataset(self):
+        diagnostics = Diagnostics()
+        years = import_statement(
+            FIXTURES / "statement.csv",
+            self.output_path,
+            diagnostics,
+            year_indices=[2024],
+        )
+        self.assertEqual(years, [2024])
+        self.assertFalse((self.output_path / "finances-2023.pickle").exists())
+        self.assertFalse((self.output_path / "imported-2023.jsonl").exists())
+        self.assertEqual(diagnostics.count_by_rule()[YEAR_OUT_OF_RANGE], 2)
+
+    def test_ofx(self):
+        # Use a small block size to exercise tags split across reads.
+        with mock.patch("main.OFX_BLOCK_SIZE", 7):
+            diagnostics = Diagnostics()
+            self.assertEqual(
+                import_statement(
+                    FIXTURES / "statement.ofx", self.output_path, diagnostics
+                ),
+                [2024],
+            )
+        year = load_year(2024, self.output_path)
+        self.assertEqual([m.num_transactions() for m in year.months], [0, 0, 2, 1])
+        t = year.months[2].transactions[0]
+        self.assertEqual(t.date, datetime.date(2024, 3, 3))
+        self.assertEqual(t.transaction_type, TransactionType.POS)
+        self.assertEqual(t.description, "BOOK SHOP")
+        self.assertEqual(t.note, "Paperbacks")
+        self.assertAlmostEqual(t.amount, -12.5)
+        self.assertEqual(year.months[2].transactions[1].transaction_type.name, "DD")
+        self.assertEqual(year.months[3].transactions[0].transaction_type.name, "ITF")
+        self.assertEqual(diagnostics.count_by_rule(), {SKIPPED_ROW: 1})
+
+    def test_reparse_keeps_imported(self):
+        save_tables(2024, [make_table(2024, 1, 2)], self.output_path)
+        reparse_years([2024], self.output_path, jobs=1)
+        import_statement(FIXTURES / "statement.csv", self.output_path)
+        y2024 = load_year(2024, self.output_path)
+        self.assertEqual([m.num_transactions() for m in y2024.months], [5, 1])
+        for _ in range(2):
+            (year,) = reparse_years([2024], self.output_path, jobs=1)
+            self.assertEqual([m.num_transactions() for m in year.months], [5, 1])
+        # Years with only imported transactions are rebuilt too.
+        (year,) = reparse_years([2023], self.output_path, jobs=1)
+        self.assertEqual(year.months[11].num_transactions(), 2)
+        self.assertNotIn(REMOVED, [x["change"] for x in read_journal(self.output_path)])
+
+    def test_statement_spanning_years(self):
+        # Return to years already saved, repeating one transaction from each.
+        with open(FIXTURES / "statement.csv", encoding="utf-8") as f:
+            header, *rows = f.read().splitlines()
+        filename = self.output_path / "unordered.csv"
+        filename.write_text("\n".join([header] + rows + rows[0:1] + rows[2:3]) + "\n")
+        import_statement(filename, self.output_path)
+        self.assertEqual(
+            [m.num_transactions() for m in load_year(2024, self.output_path).months],
+            [3, 1],
+        )
+        self.assertEqual(
+            load_year(2023, self.output_path).months[11].num_transactions(), 2
+        )
+
+
+class TestRuleSet(unittest.TestCase):
+    def setUp(self):
+        self.rules = RuleSet(
+            [
+                Rule("hers", Category.SHOPPING),
+                Rule("she", Category.HOUSE, transaction_type=TransactionType.DD),
+                Rule("he", Category.MISC, max_amount=0.0),
+                Rule("his", Category.TRAVEL),
+                Rule("e", Category.CASH, min_amount=100.0),
+            ]
+        )
+
+    def test_overlapping_matches(self):
+        self.assertEqual(self.rules.matches("USHERS"), (0, 1, 2, 4))
+        self.assertEqual(self.rules.matches("this"), (3,))
+        self.assertEqual(self.rules.matches("xyz"), ())
+
+    def test_first_accepted_rule_wins(self):
+        c = self.rules.categorise
+        self.assertEqual(c("ushers", TransactionType.POS, -1.0), Category.SHOPPING)
+        self.assertEqual(c("ushe", TransactionType.DD, 1.0), Category.HOUSE)
+        self.assertEqual(c("ushe", TransactionType.POS, -1.0), Category.MISC)
+        self.assertEqual(c("ushe", TransactionType.POS, 200.0), Category.CASH)
+        self.assertIsNone(c("ushe", TransactionType.POS, 1.0))
+
+    def test_many_rules(self):
+        rules = RuleSet([Rule(f"payee {i:04d}", Category.BILLS) for i in range(1000)])
+        self.assertEqual(rules.matches("DD PAYEE 0123 REF"), (123,))
+
+    def test_pickle_round_trip(self):
+        rules = pickle.loads(pickle.dumps(self.rules))
+        self.assertEqual(rules.matches("USHERS"), (0, 1, 2, 4))
+
+    def test_load(self):
+        rules = RuleSet.load(FIXTURES / "rules.json")
+        self.assertEqual(len(rules.rules), 5)
+        self.assertEqual(
+            rules.categorise("ENERGY CO", TransactionType.DD, -85.0), Category.BILLS
+        )
+        self.assertIsNone(rules.categorise("ENERGY CO", TransactionType.POS, -85.0))
+
+    def test_read_worksheet_unknown_category(self):
+        table = make_table(2024, 1, 2)
+        table[1][2] = ""
+        table[1][3] = "COFFEE SHOP"
+        table[2][2] = "unknown"
+        diagnostics = Diagnostics()
+        rules = RuleSet.load(FIXTURES / "rules.json")
+        month = read_worksheet(table, 2024, 0, diagnostics, rules)
+        self.assertEqual(month.num_transactions(), 1)
+        self.assertEqual(month.transactions[0].category, Category.FOOD_AND_DRINK)
+        self.assertTrue(month.transactions[0].auto_category)
+        self.assertEqual(diagnostics.count_by_rule(), {UNKNOWN_CATEGORY: 1})
+
+    def test_parallel_parse_with_rules(self):
+        tables = {2024: [make_table(2024, month, 2) for month in range(1, 4)]}
+        for table in tables[2024]:
+            table[1][2] = ""
+            table[1][3] = "COFFEE SHOP"
+        rules = RuleSet.load(FIXTURES / "rules.json")
+        (year,) = parse_years(tables, jobs=2, rules=rules)
+        self.assertEqual(
+            [m.transactions[0].category for m in year.months],
+            [Category.FOOD_AND_DRINK] * 3,
+        )
+
+    def test_recategorise_keeps_given_categories(self):
+        output_path = Path(tempfile.mkdtemp())
+        try:
+            # A worksheet row the user categorised as MISC by hand.
+            table = make_table(2024, 1, 1)
+            table[1][2] = "misc"
+            table[1][3] = "COFFEE SHOP"
+            save_tables(2024, [table], output_path)
+            reparse_years([2024], output_path, jobs=1)
+            import_statement(FIXTURES / "statement.csv", output_path)
+            rules = RuleSet.load(FIXTURES / "rules.json")
+            recategorise([2023, 2024], output_path, rules)
+            # Re-parsing without the rules keeps the new categories.
+            y2023, y2024 = reparse_years([2023, 2024], output_path, jobs=1)
+            t = y2024.months[0].transactions[0]
+            self.assertEqual((t.category, t.auto_category), (Category.MISC, False))
+            imported = y2023.months[11].transactions + y2024.months[0].transactions[1:]
+            self.assertTrue(all(t.auto_category for t in imported))
+            self.assertEqual(
+                [t.category for t in imported],
+                [
+                    Category.FOOD_AND_DRINK,
+                    Category.INCOME,
+                    Category.BILLS,
+                    Category.FOOD_AND_DRINK,
+                    Category.FOOD_AND_DRINK,
+                ],
+            )
+        finally:
+            shutil.rmtree(output_path)
+
+    def test_import_and_recategorise(self):
+        output_path = Path(tempfile.mkdtemp())
+        try:
+            rules = RuleSet.load(FIXTURES / "rules.json")
+            years = [
+                load_year(x, output_path)
+                for x in import_statement(FIXTURES / "statement.csv", output_path)
+            ]
+            self.assertEqual(
+                {t.category for y in years for m in y.months for t in m.transactions},
+                {Category.MISC},
+            )
+            counts = recategorise_years(years, rules)
+            self.assertEqual(
+                counts,
+                {
+                    Category.FOOD_AND_DRINK: 3,
+                    Category.INCOME: 1,
+                    Category.BILLS: 1,
+                    Category.SAVING: 1,
+                },
+            )
+            shutil.rmtree(output_path)
+            output_path.mkdir()
+            import_statement(FIXTURES / "statement.ofx", output_path, rules=rules)
+            year = load_year(2024, output_path)
+            self.assertEqual(year.months[2].transactions[0].category, Category.SHOPPING)
+            self.assertEqual(year.months[2].transactions[1].category, Category.MISC)
+        finally:
+            shutil.rmtree(output_path)
+
+
+class TestJournal(unittest.TestCase):
+    def make_year(self, transactions) -> Year:
+        y = Year(2024)
+        m = Month(1)
+        m.transactions = transactions
+        y.months.append(m)
+        return y
+
+    def test_diff(self):
+        a = make_transaction(Category.BILLS, -10.0)
+        b = make_transaction(Category.BILLS, -10.0)
+        c = make_transaction(Category.MISC, -5.0)
+        old = self.make_year([a, b, c])
+        # Drop one of the duplicates, recategorise c with a reformatted
+        # description, and add a new transaction.
+        c2 = make_transaction(Category.SHOPPING, -5.0)
+        c2.description = " TEST "
+        d = make_transaction(Category.INCOME, 50.0)
+        new = self.make_year([a, c2, d])
+        changes = {(x.change, x.key[-1], x.key[2]) for x in diff_years(old, new)}
+        self.assertEqual(
+            changes,
+            {(REMOVED, 1, -10.0), (MODIFIED, 0, -5.0), (ADDED, 0, 50.0)},
+        )
+
+    def test_no_changes(self):
+        old = self.make_year([make_transaction(Category.BILLS, -10.0)])
+        new = self.make_year([make_transaction(Category.BILLS, -10.0)])
+        self.assertEqual(diff_years(old, new), [])
+
+    def test_journal_written_on_save(self):
+        output_path = Path(tempfile.mkdtemp())
+        try:
+            table = make_table(2024, 1, 3)
+            save_tables(2024, [table], output_path)
+            reparse_years([2024], output_path, jobs=1)
+            table[2][2] = "bills"
+            table.pop()
+            save_tables(2024, [table], output_path)
+            reparse_years([2024], output_path, jobs=1)
+            entries = list(read_journal(output_path))
+            self.assertEqual(
+                [x["change"] for x in entries], [ADDED] * 3 + [MODIFIED, REMOVED]
+            )
+            self.assertEqual(entries[3]["transaction"]["category"], "BILLS")
+            self.assertEqual(entries[3]["previous"]["category"], "SHOPPING")
+            self.assertEqual(changed_months(entries), {(2024, 1)})
+            self.assertEqual(list(read_journal(output_path, since="9999")), [])
+        finally:
+            shutil.rmtree(output_path)
+
+
+class TestReport(unittest.TestCase):
+    def setUp(self):
+        self.years = []
+        for year_num in (2023, 2024):
+            y = Year(year_num)
+            for month_num in (1, 2):
+                m = Month(month_num)
+                m.transactions = [
+                    make_transaction(Category.BILLS, -10.0, year_num, month_num),
+                    make_transaction(Category.INCOME, 25.0, year_num, month_num),
+                ]
+                y.months.append(m)
+            self.years.append(y)
+
+    def test_filters(self):
+        rows = list(iter_rows(self.years, [2], [Category.INCOME]))
+        self.assertEqual([(x[0], x[1]) for x in rows], [(2023, 2), (2024, 2)])
+        self.assertEqual(
+            list(select_columns(rows, ["year", "category", "amount"])),
+            [[2023, "INCOME", 25.0], [2024, "INCOME", 25.0]],
+        )
+
+    def test_rows_are_streamed(self):
+        def years():
+            yield self.years[0]
+            raise AssertionError("Read past the first page")
+
+        rows = iter_rows(years())
+        self.assertEqual(len(list(itertools.islice(rows, 4))), 4)
+
+    def test_summarise(self):
+        headers, rows = summarise_rows(iter_rows(self.years), ["year", "category"])
+        self.assertEqual(headers, ["year", "category", "count", "total"])
+        self.assertEqual(
+            rows,
+            [
+                [2023, "BILLS", 2, -20.0],
+                [2023, "INCOME", 2, 50.0],
+                [2024, "BILLS", 2, -20.0],
+                [2024, "INCOME", 2, 50.0],
+            ],
+        )
+
+    def test_formats(self):
+        columns = ["date", "amount"]
+        stream = io.StringIO()
+        count = write_report(
+            select_columns(iter_rows(self.years), columns), columns, TSV, stream
+        )
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(count, 8)
+        self.assertEqual(lines[:2], ["date\tamount", "2023-01-01\t-10.0"])
+        stream = io.StringIO()
+        write_report([[datetime.date(2024, 1, 1), 1.5]], columns, JSONL, stream)
+        self.assertEqual(
+            json.loads(stream.getvalue()), {"date": "2024-01-01", "amount": 1.5}
+        )
+        stream = io.StringIO()
+        write_report(
+            select_columns(iter_rows(self.years), columns),
+            columns,
+            TABLE,
+            stream,
+            page_size=3,
+        )
+        # One table per page, each with its own header.
+        self.assertEqual(stream.getvalue().count("date"), 3)
+
+    def test_page_size_must_be_positive(self):
+        self.assertEqual(positive_int("25"), 25)
+        for value in ["0", "-1", "ten"]:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                positive_int(value)
+
+
 class TestHtmlRendering(unittest.TestCase):
     def setUp(self):
         self.faker = Faker("en_UK")
@@ -221,6 +895,7 @@ class TestHtmlRendering(unittest.TestCase):
         self.assertTrue((self.output_path / "index.html").exists())
         self.assertTrue((self.output_path / "year-2024.html").exists())
         self.assertTrue((self.output_path / "transactions-1-2024.html").exists())
+        self.assertTrue((self.output_path / "trends.html").exists())
 
     def test_many_transactions(self):
         YEARS = range(2000, 2005)
@@ -244,10 +919,121 @@ class TestHtmlRendering(unittest.TestCase):
                     ).exists()
                 )
 
+    def test_search_index(self):
+        y = Year(2024)
+        for month_num in (1, 2):
+            m = Month(month_num)
+            m.transactions = [
+                make_transaction(Category.MISC, 1.0, month=month_num),
+                make_transaction(Category.MISC, 2.0, month=month_num),
+            ]
+            m.transactions[1].description = "Coffee shop"
+            m.transactions[1].note = "Test, coffee"
+            y.months.append(m)
+        shards = build_index([y])
+        self.assertEqual(
+            shards["te"], {"test": [2024, 1, 0, 2024, 1, 1, 2024, 2, 0, 2024, 2, 1]}
+        )
+        self.assertEqual(shards["co"], {"coffee": [2024, 1, 1, 2024, 2, 1]})
+        self.assertEqual(shards["sh"], {"shop": [2024, 1, 1, 2024, 2, 1]})
+        Finances([y]).render_html(self.output_path)
+        self.assertTrue((self.output_path / "search.html").exists())
+        with gzip.open(self.output_path / "search" / "index-co.json.gz") as f:
+            self.assertEqual(json.load(f), shards["co"])
+        with gzip.open(self.output_path / "search" / "rows-2024-2.json.gz") as f:
+            rows = json.load(f)
+        self.assertEqual(rows[1][3], "Coffee shop")
+
     def test_empty_finances_renders(self):
         Finances([]).render_html(self.output_path)
         self.assertTrue((self.output_path / "index.html").exists())
 
+    def make_finances(self, name: str, amount: float) -> Finances:
+        y = Year(2024)
+        for month_num in (1, 2):
+            m = Month(month_num)
+            m.transactions = [make_transaction(Category.BILLS, amount, month=month_num)]
+            y.months.append(m)
+        return Finances([y], name, name.title())
+
+    def test_incremental_render(self):
+        f = self.make_finances("", -10.0)
+        f.render_html(self.output_path)
+        january = self.output_path / "transactions-1-2024.html"
+        february = self.output_path / "transactions-2-2024.html"
+        january.write_text("stale")
+        february.write_text("stale")
+        f.render_html(self.output_path, changed={(2024, 2)})
+        self.assertEqual(january.read_text(), "stale")
+        self.assertNotEqual(february.read_text(), "stale")
+        # Missing pages are rendered even if unchanged.
+        january.unlink()
+        f.render_html(self.output_path, changed=set())
+        self.assertFalse(january.exists())
+        f.render_html(self.output_path, changed={(2024, 2)})
+        self.assertTrue(january.exists())
+
+    def test_datasets(self):
+        datasets = Datasets(
+            [self.make_finances("current", -10.0), self.make_finances("savings", 5.0)]
+        )
+        self.assertEqual(
+            datasets.datasets[0].category_totals(), {2024: {"BILLS": -20.0}}
+        )
+        datasets.render_html(self.output_path)
+        index = (self.output_path / "index.html").read_text()
+        self.assertIn("Savings", index)
+        self.assertIn("£-10.00", index)
+        for name in ("current", "savings"):
+            index = (self.output_path / name / "index.html").read_text()
+            self.assertIn('href="../main.css"', index)
+            self.assertTrue((self.output_path / name / "year-2024.html").exists())
+            self.assertTrue((self.output_path / name / "search.html").exists())
+        # An unchanged dataset is not loaded; its totals come from its summary.
+        datasets = Datasets(
+            [Finances([], "current", "Current"), self.make_finances("savings", 6.0)]
+        )
+        datasets.render_html(
+            self.output_path, changed={"current": set(), "savings": {(2024, 1)}}
+        )
+        self.assertIn("£-8.00", (self.output_path / "index.html").read_text())
+        self.assertTrue((self.output_path / "current" / "year-2024.html").exists())
+
+    def test_render_context_change(self):
+        datasets = [Dataset("", "Finances", {2024: SHEETS[2024]})]
+        context = render_context(datasets)
+        self.output_path.joinpath(SUMMARY).write_text("{}")
+        write_render_stamp(self.output_path, "2024-01-01T00:00:00", context)
+        self.assertEqual(changes_since_render(self.output_path, context), set())
+        # A new year changes the navigation bar of every page.
+        datasets[0].sheets[2025] = SHEETS[2025]
+        self.assertIsNone(
+            changes_since_render(self.output_path, render_context(datasets))
+        )
+        # So does a new title.
+        datasets = [Dataset("", "Household", {2024: SHEETS[2024]})]
+        self.assertIsNone(
+            changes_since_render(self.output_path, render_context(datasets))
+        )
+
+    def test_load_datasets(self):
+        filename = self.output_path / "datasets.json"
+        entries = [
+            {
+                "name": "current",
+                "title": "Current account",
+                "sheets": {"2024": {"name": "Current 2024", "format": "new"}},
+            }
+        ]
+        filename.write_text(json.dumps(entries))
+        (dataset,) = load_datasets(str(filename))
+        self.assertEqual(dataset.name, "current")
+        self.assertEqual(dataset.sheets[2024].name, "Current 2024")
+        self.assertIs(dataset.sheets[2024].reader, read_worksheet)
+        filename.write_text(json.dumps(entries * 2))
+        with self.assertRaises(RuntimeError):
+            load_datasets(str(filename))
+
 
 if __name__ == "__main__":
     unittest.main()